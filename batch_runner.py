@@ -0,0 +1,103 @@
+# batch_runner.py
+# Answers a JSONL file of queries with the RAG graph, without the Streamlit UI.
+#
+#   python batch_runner.py queries.jsonl answers.jsonl --concurrency 8
+#
+# Every input line is a JSON object with a "query", an optional "id" and
+# optional "metadata" filters ({"content_type": ..., "keywords": [...]}). One
+# result line is appended to the output file as soon as its query finishes, so
+# the output follows completion order and survives an interrupted run.
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+from src.agent_state import new_request
+from workflow_setup import get_graph
+
+logger = logging.getLogger(__name__)
+
+def read_queries(path: str):
+    # Yields (line number, record) lazily so large evaluation sets are never fully loaded
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping invalid JSON on line {line_number}: {str(e)}")
+                continue
+            if not isinstance(record, dict) or not record.get("query"):
+                logger.error(f"Skipping line {line_number}: missing 'query'")
+                continue
+            yield line_number, record
+
+async def answer_query(graph, record: dict) -> dict:
+    query_id = str(record.get("id") or uuid.uuid4())
+    result = {"id": query_id, "query": record["query"]}
+    start = time.perf_counter()
+    try:
+        inputs = new_request(record["query"], query_id=query_id, metadata=record.get("metadata") or {})
+        state = await graph.ainvoke(inputs)
+        result["final_response"] = state.get("final_response")
+        result["sub_queries"] = state.get("sub_queries")
+        result["error"] = None
+    except Exception as e:
+        logger.error(f"Error answering query {query_id}: {str(e)}")
+        result["final_response"] = None
+        result["error"] = str(e)
+    result["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+async def run_batch(graph, input_path: str, output_path: str, concurrency: int) -> dict:
+    # The semaphore is taken before each task is created, so at most
+    # `concurrency` queries are in flight and the input is read only as fast
+    # as they complete
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    counts = {"completed": 0, "failed": 0}
+    tasks = set()
+    start = time.perf_counter()
+
+    with open(output_path, "a") as output:
+        async def run_one(record):
+            try:
+                result = await answer_query(graph, record)
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                counts["failed" if result["error"] else "completed"] += 1
+            finally:
+                semaphore.release()
+
+        for _, record in read_queries(input_path):
+            await semaphore.acquire()
+            task = asyncio.create_task(run_one(record))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - start
+    total = counts["completed"] + counts["failed"]
+    return {**counts, "seconds": round(elapsed, 3), "queries_per_second": round(total / elapsed, 3) if elapsed else 0.0}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of queries with the RAG graph.")
+    parser.add_argument("input", help="JSONL file with one {\"query\": ..., \"id\": ...} object per line.")
+    parser.add_argument("output", help="JSONL file the answers are appended to.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of queries in flight.")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    graph = get_graph()
+    summary = asyncio.run(run_batch(graph, args.input, args.output, args.concurrency))
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# benchmarks/fakes.py
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from src.local_vector_store import LocalVectorStore
+
+# Offline stand-ins for the OpenAI and Pinecone clients. Each one sleeps for a
+# configurable latency so the benchmarks model network round trips without
+# making any.
+
+class FakeChatModel(BaseChatModel):
+    latency_seconds: float = 0.05
+    sub_query_count: int = 4
+    response_words: int = 200
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _respond(self, prompt: str) -> str:
+        # Decomposition gets a numbered list of sub-queries; every other prompt
+        # gets filler text derived from the prompt so outputs differ per query
+        if "decompose it into" in prompt:
+            query = prompt.split("Original query:", 1)[-1].split("\n", 1)[0].strip()
+            return "Sub-queries:\n" + "\n".join(f"{i + 1}. Aspect {i + 1} of {query}" for i in range(self.sub_query_count))
+        words = prompt.split()[-self.response_words:]
+        return " ".join(words)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        message = AIMessage(content=self._respond(messages[-1].content))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        message = AIMessage(content=self._respond(messages[-1].content))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    latency_seconds: float = 0.01
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # One round trip per batched request, as with the real API
+        time.sleep(self.latency_seconds)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_seconds)
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency_seconds)
+        return super().embed_documents(texts)
+
+class FakeVectorStore(LocalVectorStore):
+    # Local store with an injected per-query latency standing in for Pinecone
+    def __init__(self, path: str, embedding, latency_seconds: float = 0.02, **kwargs):
+        super().__init__(path, embedding, **kwargs)
+        self.latency_seconds = latency_seconds
+
+    def _top_k(self, embedding, k, mask=None):
+        time.sleep(self.latency_seconds)
+        return super()._top_k(embedding, k, mask)
+
+class FakeEmbeddingServer:
+    # Local embeddings endpoint with injected latency (a fast body plus an
+    # occasional slow tail) and a share of 503s. Entries appended to script
+    # as (latency_ms, status) answer the next requests exactly, in order.
+
+    def __init__(self, latency_ms: float, tail_rate: float, tail_ms: float, error_rate: float, dimension: int = 64):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+                with server.lock:
+                    server.requests += 1
+                    scripted = server.script.pop(0) if server.script else None
+                if scripted:
+                    latency_ms, status = scripted
+                else:
+                    latency_ms = server.tail_ms if random.random() < server.tail_rate else server.latency_ms
+                    status = 503 if random.random() < server.error_rate else 200
+                time.sleep(latency_ms / 1000)
+                if status != 200:
+                    self.send_response(status)
+                    self.end_headers()
+                    return
+                body = json.dumps({"data": [{"embedding": [float(len(text))] * server.dimension} for text in texts]}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except ConnectionError:
+                    pass  # the client stopped waiting, e.g. for the losing side of a hedge
+
+            def log_message(self, format, *args):
+                pass
+
+        self.latency_ms = latency_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.error_rate = error_rate
+        self.dimension = dimension
+        self.requests = 0
+        self.script = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/embeddings"
+        threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, name="fake-embedding-server", daemon=True).start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
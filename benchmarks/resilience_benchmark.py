@@ -0,0 +1,95 @@
+# benchmarks/resilience_benchmark.py
+# Measures the resilience layer against a local fake embeddings server.
+#
+#   python -m benchmarks.resilience_benchmark --requests 500 --tail-rate 0.03 --error-rate 0.02
+#
+# The server answers after an injected latency (a fast body plus an occasional
+# slow tail) and fails a share of requests with 503s. The same requests are
+# sent with no policy, with deadlines and retries, and with hedging as well, and
+# the latency percentiles and failures of each run are compared.
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from benchmarks.fakes import FakeEmbeddingServer
+from benchmarks.run_benchmarks import summarize
+from src.resilience import CircuitBreaker, ResiliencePolicy
+
+def run(client: httpx.Client, url: str, policy, requests: int, concurrency: int) -> dict:
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def embed(i):
+        response = client.post(url, json={"input": [f"text {i}"]})
+        response.raise_for_status()
+        return response.json()["data"]
+
+    def run_one(i):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            policy.call(embed, i) if policy else embed(i)
+        except Exception:
+            with lock:
+                failures += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_one, range(requests)))
+    result = {"latency": summarize(latencies), "failures": failures}
+    if policy:
+        result["policy"] = policy.stats()
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare call policies against a fake server with injected latency and errors.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument("--tail-rate", type=float, default=0.03, help="Share of requests that take --tail-ms.")
+    parser.add_argument("--tail-ms", type=float, default=500)
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of requests answered with a 503.")
+    parser.add_argument("--deadline", type=float, default=2.0, help="Seconds allowed per call, retries included.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    # Every retry and hedge is logged; only the summary is wanted here
+    logging.basicConfig(level=logging.WARNING, force=True)
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    server = FakeEmbeddingServer(args.latency_ms, args.tail_rate, args.tail_ms, args.error_rate)
+    # The breaker threshold is out of reach here; this measures retries and hedging
+    policies = {
+        "none": None,
+        "retries": ResiliencePolicy("embeddings", deadline_seconds=args.deadline, breaker=CircuitBreaker(failure_threshold=args.requests)),
+        "retries+hedging": ResiliencePolicy("embeddings", deadline_seconds=args.deadline, breaker=CircuitBreaker(failure_threshold=args.requests), hedge=True),
+    }
+    results = {"config": vars(args), "runs": {}}
+    try:
+        with httpx.Client(limits=httpx.Limits(max_connections=4 * args.concurrency)) as client:
+            for name, policy in policies.items():
+                result = run(client, server.url, policy, args.requests, args.concurrency)
+                results["runs"][name] = result
+                latency = result["latency"]
+                print(
+                    f"{name}: p50 {latency.get('p50_ms', 0):.1f}ms p95 {latency.get('p95_ms', 0):.1f}ms "
+                    f"p99 {latency.get('p99_ms', 0):.1f}ms failures {result['failures']}"
+                    + (f" retries {result['policy']['retries']} hedges {result['policy']['hedges']}" if policy else "")
+                )
+    finally:
+        server.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
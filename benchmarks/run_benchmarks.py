@@ -0,0 +1,208 @@
+# benchmarks/run_benchmarks.py
+# Offline end-to-end benchmarks for the RAG graph.
+#
+#   python -m benchmarks.run_benchmarks --output bench_results.json
+#   python -m benchmarks.run_benchmarks --baseline bench_results.json
+#
+# The real create_workflow(AgentState) graph is compiled against fake chat
+# models, embeddings and a local vector store with injected latency, so the
+# run needs no credentials or network access.
+import argparse
+import inspect
+import json
+import logging
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakeVectorStore
+from src import providers
+from src.agent_state import new_request
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+EMBEDDING_DIMENSION = 256
+
+def summarize(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    summary = {f"p{p}_ms": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean_ms"] = float(values.mean())
+    summary["count"] = len(samples)
+    return summary
+
+class NodeTimer:
+    # node_wrapper for create_workflow that records the wall time of every node call
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _record(self, name, start):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[name].append(elapsed)
+
+    def __call__(self, name, func):
+        if inspect.iscoroutinefunction(func):
+            async def timed_async_node(state):
+                start = time.perf_counter()
+                try:
+                    return await func(state)
+                finally:
+                    self._record(name, start)
+            return timed_async_node
+
+        def timed_node(state):
+            start = time.perf_counter()
+            try:
+                return func(state)
+            finally:
+                self._record(name, start)
+        return timed_node
+
+def build_corpus(path: str, embeddings, doc_count: int, doc_chars: int) -> FakeVectorStore:
+    store = FakeVectorStore(path, embeddings, latency_seconds=0)
+    words = "vector retrieval graph node prompt context query token model embedding".split()
+    texts = []
+    for i in range(doc_count):
+        text = " ".join(words[(i + j) % len(words)] for j in range(doc_chars // 8))
+        texts.append(f"Document {i}: {text}"[:doc_chars])
+    store.add_texts(texts, ids=[f"doc-{i}" for i in range(doc_count)])
+    return store
+
+def run_requests(graph, requests: int, sessions: int, on_done=None) -> list:
+    def run_query(i):
+        start = time.perf_counter()
+        result = graph.invoke(new_request(f"Benchmark question {i}: how do I build a RAG pipeline?"))
+        if on_done:
+            on_done(time.perf_counter() - start)
+        return result
+
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        return list(executor.map(run_query, range(requests)))
+
+def run_scenario(graph, timer: NodeTimer, requests: int, sessions: int) -> dict:
+    # Peak memory comes from a separate pass: tracemalloc hooks every
+    # allocation, which would inflate the latencies measured next to it
+    tracemalloc.start()
+    run_requests(graph, requests, sessions)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timer.samples.clear()
+    end_to_end = []
+    lock = threading.Lock()
+
+    def record(elapsed):
+        with lock:
+            end_to_end.append(elapsed)
+
+    start = time.perf_counter()
+    results = run_requests(graph, requests, sessions, on_done=record)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "end_to_end": summarize(end_to_end),
+        "nodes": {name: summarize(samples) for name, samples in sorted(timer.samples.items())},
+        "throughput_qps": requests / wall_time,
+        "peak_memory_mb": peak_memory / (1024 * 1024),
+        "completed": sum(1 for result in results if result.get("final_response")),
+    }
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    # A scenario regresses when its end-to-end p95 grows by more than max_regression
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        current_p95 = scenario["end_to_end"]["p95_ms"]
+        previous_p95 = previous["end_to_end"]["p95_ms"]
+        if current_p95 > previous_p95 * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous_p95:.1f}ms -> {current_p95:.1f}ms")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the RAG graph.")
+    parser.add_argument("--sub-query-counts", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--doc-chars", type=int, nargs="+", default=[500, 4000])
+    parser.add_argument("--doc-count", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent sessions issuing requests.")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--embedding-latency-ms", type=float, default=10)
+    parser.add_argument("--vector-latency-ms", type=float, default=20)
+    parser.add_argument("--routing", action="store_true", help="Let the query router send simple queries down the fast path.")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Previous results to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative p95 growth before failing.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    logging.getLogger("src").setLevel(logging.WARNING)
+
+    # Swap the provider registry over to the fakes before anything builds a client
+    chat_model = FakeChatModel(latency_seconds=args.llm_latency_ms / 1000)
+    embeddings = FakeEmbeddings(size=EMBEDDING_DIMENSION, latency_seconds=args.embedding_latency_ms / 1000)
+    providers.register_provider("chat_model", lambda **kwargs: chat_model)
+    providers.register_provider("embeddings", lambda: embeddings)
+    # Every scenario reuses the same questions, so the LLM response and node
+    # caches would turn later runs into cache hits
+    providers.register_provider("llm_cache", lambda: None)
+    providers.register_provider("node_cache", lambda: None)
+
+    from src.agent_state import AgentState
+    from src.workflow import create_workflow
+
+    timer = NodeTimer()
+    # Routing is off by default: the benchmark questions are simple, and the
+    # sub-query scenarios only exercise decomposition on the full path
+    graph = create_workflow(AgentState, routing=args.routing, node_wrapper=timer).compile()
+
+    results = {
+        "config": vars(args),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for doc_chars in args.doc_chars:
+            store = build_corpus(f"{tmp_dir}/corpus-{doc_chars}", embeddings, args.doc_count, doc_chars)
+            store.latency_seconds = args.vector_latency_ms / 1000
+            providers.register_provider("vector_store", lambda store=store: store)
+
+            for sub_query_count in args.sub_query_counts:
+                chat_model.sub_query_count = sub_query_count
+                name = f"sub_queries={sub_query_count},doc_chars={doc_chars}"
+                scenario = run_scenario(graph, timer, args.requests, args.sessions)
+                results["scenarios"][name] = scenario
+                print(
+                    f"{name}: p50 {scenario['end_to_end']['p50_ms']:.1f}ms "
+                    f"p95 {scenario['end_to_end']['p95_ms']:.1f}ms "
+                    f"p99 {scenario['end_to_end']['p99_ms']:.1f}ms "
+                    f"{scenario['throughput_qps']:.1f} req/s "
+                    f"peak {scenario['peak_memory_mb']:.1f}MB"
+                )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,17 @@
 import json
 import logging
-from langchain_openai import ChatOpenAI
+from functools import cache
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from src.providers import get_chat_model
+from src.llm_cache import cached_llm_call
+from src.resilience import with_resilience
 
 # Set up logging
 logger = logging.getLogger(__name__)
 MODEL_NAME = "gpt-4o-mini"
 
-# LLM and Prompt Setup for Auto Populate
-llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
+# Prompt Setup for Auto Populate; the LLM client is created on first use
 output_parser = StrOutputParser()  # To parse the LLM output
 
 auto_populate_prompt_template = PromptTemplate(
@@ -36,23 +38,31 @@ auto_populate_prompt_template = PromptTemplate(
     input_variables=["user_input"]
 )
 
+@cache
+def get_auto_populate_chain():
+    # Built once per process and shared by every session
+    return with_resilience(auto_populate_prompt_template | get_chat_model(MODEL_NAME, temperature=0) | output_parser, "transformation")
+
+def _generate_fields(user_input):
+    # Run the sequence with the user input
+    response = get_auto_populate_chain().invoke({"user_input": user_input})
+
+    # Log the raw response to check its content
+    logger.info(f"Raw LLM response: {response}")
+
+    # Strip out the ```json markers if they exist
+    response = response.strip().strip('```').strip('json').strip()
+
+    # Parse JSON from the response
+    return json.loads(response)
+
 def auto_populate_fields(user_input):
     try:
-        # Create a sequence of the prompt template and LLM
-        sequence = auto_populate_prompt_template | llm | output_parser
-        
-        # Run the sequence with the user input
-        response = sequence.invoke({"user_input": user_input})
-        
-        # Log the raw response to check its content
-        logger.info(f"Raw LLM response: {response}")
-
-        # Strip out the ```json markers if they exist
-        response = response.strip().strip('```').strip('json').strip()
-
-        # Parse JSON from the response
-        parsed_data = json.loads(response)
-        return parsed_data
+        # Only responses that parse are cached, so a malformed one is retried next time
+        return cached_llm_call(
+            "auto_populate", MODEL_NAME, auto_populate_prompt_template.template, user_input,
+            lambda: _generate_fields(user_input)
+        )
     except json.JSONDecodeError as e:
         logger.error(f"JSON decoding error: {str(e)}")
         return {}
@@ -1,12 +1,44 @@
 # src/agent_state.py
+import uuid
 from typing import Annotated, Sequence, TypedDict, List, Optional
-from langchain_core.messages import BaseMessage
-from langgraph.graph.message import add_messages
+from langchain_core.messages import BaseMessage, RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES, add_messages
+
+def keep_latest(current, update):
+    # Reducer for fields written by parallel branches: the newest write that is
+    # not None wins, so empty values ("" or []) still reset the field
+    return update if update is not None else current
 
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
-    sub_queries: Optional[List[str]]  # List of sub-queries
+    sub_queries: Annotated[Optional[List[str]], keep_latest]  # List of sub-queries
+    retrieved_documents: Optional[List[List[dict]]]  # Scored chunks per sub-query: id, content, metadata, score
     summarized_content: Optional[List[str]]  # Summarized content or retrieved documents
     final_response: Optional[str]  # Final generated response
     rewritten_query: Optional[str]
+    step_back_query: Annotated[Optional[str], keep_latest]
     initial_query: Optional[str]
+    query_id: Optional[str]  # Labels metrics and traces for one request
+    metadata: Optional[dict]  # Request filters from the form: keywords, content_type
+    route: Optional[str]  # "simple" skips query transformation, "complex" runs it
+
+def new_request(query: str, query_id: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+    # Graph input for one request. With a checkpointer the state of a thread
+    # carries over between requests, so every per-request field is reset here
+    # and nodes read the query from initial_query rather than the message
+    # history. Empty values (not None) reset the keep_latest fields, and the
+    # previous request's messages are removed so the history does not grow
+    # with every resubmit.
+    return {
+        "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), ("user", query)],
+        "initial_query": query,
+        "query_id": query_id or str(uuid.uuid4()),
+        "metadata": metadata or {},
+        "route": None,
+        "rewritten_query": None,
+        "step_back_query": "",
+        "sub_queries": [],
+        "retrieved_documents": None,
+        "summarized_content": None,
+        "final_response": None,
+    }
@@ -0,0 +1,62 @@
+# src/checkpointer.py
+import logging
+from langgraph.checkpoint.sqlite import SqliteSaver
+from src.configs.config import CHECKPOINT_KEEP_PER_THREAD, CHECKPOINT_MAX_THREADS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class RetainingSqliteSaver(SqliteSaver):
+    # SqliteSaver that bounds its file. Every request writes one checkpoint per
+    # graph step, and every session adds a thread, so without pruning the file
+    # grows for as long as the app runs. Only the newest keep_per_thread
+    # checkpoints of a thread (and the pending writes that belong to them) are
+    # kept; the latest one holds the full state, so resuming a thread is not
+    # affected. When a request starts, threads beyond the max_threads most
+    # recently used ones are deleted. Checkpoint ids are time-ordered, which
+    # is also how SqliteSaver finds the latest checkpoint.
+
+    def __init__(self, conn, keep_per_thread: int = CHECKPOINT_KEEP_PER_THREAD, max_threads: int = CHECKPOINT_MAX_THREADS, **kwargs):
+        super().__init__(conn, **kwargs)
+        self.keep_per_thread = max(1, keep_per_thread)
+        self.max_threads = max(1, max_threads)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(saved["configurable"]["thread_id"])
+        checkpoint_ns = saved["configurable"]["checkpoint_ns"]
+        try:
+            self._prune_thread(thread_id, checkpoint_ns)
+            if metadata.get("source") == "input":
+                self._prune_threads()
+        except Exception as e:
+            # Retention is housekeeping; a failure must not fail the request
+            logger.error(f"Error pruning checkpoints: {str(e)}")
+        return saved
+
+    def _prune_thread(self, thread_id: str, checkpoint_ns: str) -> None:
+        with self.cursor() as cur:
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_per_thread),
+            )
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < "
+                "(SELECT MIN(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+            )
+
+    def _prune_threads(self) -> None:
+        with self.cursor() as cur:
+            stale = [
+                row[0] for row in cur.execute(
+                    "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC LIMIT -1 OFFSET ?",
+                    (self.max_threads,),
+                ).fetchall()
+            ]
+            for thread_id in stale:
+                cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        if stale:
+            logger.info(f"Deleted {len(stale)} idle checkpoint threads")
@@ -9,13 +9,147 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_DIMENSION = int(os.getenv("PINECONE_DIMENSION"))  
+PINECONE_DIMENSION = int(os.getenv("PINECONE_DIMENSION", "3072"))  
 PINECONE_CLOUD = os.getenv("PINECONE_CLOUD")  
 PINECONE_REGION = os.getenv("PINECONE_REGION")  
 
+# Query transformation settings: "parallel" runs step-back prompting and
+# sub-query decomposition as concurrent branches, "single_call" produces the
+# rewrite, step-back query and sub-queries from one structured LLM call
+QUERY_TRANSFORMATION_MODE = os.getenv("QUERY_TRANSFORMATION_MODE", "parallel")
+# Query routing: simple queries skip query transformation and are retrieved directly
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_MAX_SIMPLE_WORDS = int(os.getenv("ROUTER_MAX_SIMPLE_WORDS", "12"))
+ROUTER_MIN_KEYWORD_DENSITY = float(os.getenv("ROUTER_MIN_KEYWORD_DENSITY", "0.4"))
+ROUTER_FAQ_PATH = os.getenv("ROUTER_FAQ_PATH")  # representative FAQ questions, one per line
+ROUTER_FAQ_THRESHOLD = float(os.getenv("ROUTER_FAQ_THRESHOLD", "0.85"))
 
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API Key is not set in the environment.")
+# Embedding settings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")  # SQLite file; unset keeps the cache in memory only
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))
 
-if not PINECONE_API_KEY or not PINECONE_INDEX:
-    raise ValueError("Pinecone API Key or Index is not set in the environment.")
+# Vector store settings: "pinecone" or "local" (memory-mapped store on disk)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "data/vector_store")
+LOCAL_VECTOR_STORE_DTYPE = os.getenv("LOCAL_VECTOR_STORE_DTYPE", "float32")  # "float32" or "int8"
+
+# Retrieval settings
+# Searches in flight per request, and threads in the pool shared by all requests
+RETRIEVAL_MAX_CONCURRENCY = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "4"))
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "32"))
+# "fixed" returns RETRIEVAL_K chunks per sub-query; "adaptive" over-fetches
+# RETRIEVAL_FETCH_K scored candidates and keeps between RETRIEVAL_MIN_K and
+# RETRIEVAL_MAX_K of them, cutting at the score threshold or at the first
+# drop larger than RETRIEVAL_RELATIVE_GAP between neighbouring scores
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "adaptive")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "2"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "10"))
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", "1"))
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "5"))
+RETRIEVAL_SCORE_THRESHOLD = float(os.getenv("RETRIEVAL_SCORE_THRESHOLD", "0.3"))
+RETRIEVAL_RELATIVE_GAP = float(os.getenv("RETRIEVAL_RELATIVE_GAP", "0.15"))
+# Request metadata pushed into the vector query: which fields become metadata
+# filters, whether each content type has its own namespace, and whether a
+# sub-query with no filtered matches is retried against the whole index.
+# Filtering is opt-in: list only fields the index carries (e.g.
+# "content_type,keywords"), or every request on an index without them finds
+# nothing and pays for the unfiltered retry
+METADATA_FILTER_FIELDS = os.getenv("METADATA_FILTER_FIELDS", "")
+CONTENT_TYPE_NAMESPACES = os.getenv("CONTENT_TYPE_NAMESPACES", "false").lower() == "true"
+METADATA_FILTER_FALLBACK = os.getenv("METADATA_FILTER_FALLBACK", "true").lower() == "true"
+
+# Context assembly settings: chunks are deduplicated across sub-queries and
+# packed by score (or MMR) into CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_USE_MMR = os.getenv("CONTEXT_USE_MMR", "false").lower() == "true"
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.5"))
+
+# tiktoken keeps its downloaded BPE files here; a directory populated once with
+# `python -m src.token_counting` lets later runs count tokens offline
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", "data/tiktoken")
+
+# Summarization settings: sub-queries whose retrieved text is under
+# SUMMARIZATION_MIN_TOKENS skip the LLM and are passed through as-is
+SUMMARIZATION_ENABLED = os.getenv("SUMMARIZATION_ENABLED", "true").lower() == "true"
+SUMMARIZATION_MIN_TOKENS = int(os.getenv("SUMMARIZATION_MIN_TOKENS", "800"))
+SUMMARIZATION_MAX_CONCURRENCY = int(os.getenv("SUMMARIZATION_MAX_CONCURRENCY", "4"))
+
+# Semantic response cache settings
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite")  # empty keeps the cache in memory only
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1000"))
+LLM_CACHE_DISK_SIZE = int(os.getenv("LLM_CACHE_DISK_SIZE", "100000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "604800"))
+# Comma-separated chain names to bypass the cache for, e.g. "rewrite,auto_populate"
+LLM_CACHE_DISABLED_CHAINS = os.getenv("LLM_CACHE_DISABLED_CHAINS", "")
+# Keeps each Streamlit session's graph state in a SQLite checkpointer, one thread
+# per session, so the last request's state can be inspected with get_state()
+# and an interrupted run resumed. new_request() resets every field, so nothing
+# carries over between requests, and every graph step pays a checkpoint write.
+CHECKPOINTING_ENABLED = os.getenv("CHECKPOINTING_ENABLED", "false").lower() == "true"
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "data/checkpoints.sqlite")
+# Checkpoints kept per thread (a request writes one per graph step) and threads kept in the file
+CHECKPOINT_KEEP_PER_THREAD = int(os.getenv("CHECKPOINT_KEEP_PER_THREAD", "10"))
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+# Query transformation outputs memoized on the query, model and prompt; empty path keeps them in memory only
+NODE_CACHE_ENABLED = os.getenv("NODE_CACHE_ENABLED", "false").lower() == "true"
+NODE_CACHE_PATH = os.getenv("NODE_CACHE_PATH", "data/node_cache.sqlite")
+NODE_CACHE_SIZE = int(os.getenv("NODE_CACHE_SIZE", "1000"))
+NODE_CACHE_DISK_SIZE = int(os.getenv("NODE_CACHE_DISK_SIZE", "20000"))
+NODE_CACHE_TTL_SECONDS = float(os.getenv("NODE_CACHE_TTL_SECONDS", "3600"))
+INGESTION_CHUNK_SIZE = int(os.getenv("INGESTION_CHUNK_SIZE", "1000"))
+INGESTION_CHUNK_OVERLAP = int(os.getenv("INGESTION_CHUNK_OVERLAP", "200"))
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", "256"))
+INGESTION_MAX_IN_FLIGHT = int(os.getenv("INGESTION_MAX_IN_FLIGHT", "4"))
+INGESTION_UPSERT_BATCH_SIZE = int(os.getenv("INGESTION_UPSERT_BATCH_SIZE", "100"))
+INGESTION_FILE_EXTENSIONS = os.getenv("INGESTION_FILE_EXTENSIONS", ".txt,.md,.rst")
+
+# Metrics settings: comma-separated exporters out of "histogram", "prometheus" and "jsonl"
+METRICS_EXPORTERS = os.getenv("METRICS_EXPORTERS", "histogram")
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "metrics.jsonl")
+METRICS_PROMETHEUS_PORT = int(os.getenv("METRICS_PROMETHEUS_PORT", "0"))  # 0 leaves the HTTP endpoint off
+
+# State tracing settings: caps for logged state fields, full traces for 1 in
+# STATE_TRACE_SAMPLE_RATE requests (0 disables), and queue-based log handling
+STATE_TRACE_MAX_FIELD_CHARS = int(os.getenv("STATE_TRACE_MAX_FIELD_CHARS", "200"))
+STATE_TRACE_MAX_ITEMS = int(os.getenv("STATE_TRACE_MAX_ITEMS", "5"))
+STATE_TRACE_SAMPLE_RATE = int(os.getenv("STATE_TRACE_SAMPLE_RATE", "100"))
+ASYNC_LOGGING = os.getenv("ASYNC_LOGGING", "true").lower() == "true"
+
+# HTTP connection pool shared by all OpenAI clients
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+
+# Resilience settings for model and vector store calls. Deadlines are the total
+# seconds a stage may spend on one call, retries included, as "stage=seconds"
+# pairs; for the streamed generation stage it is the time to the first token.
+# Hedged stages send a duplicate request once a call runs longer than
+# HEDGE_PERCENTILE of recent latencies
+RESILIENCE_ENABLED = os.getenv("RESILIENCE_ENABLED", "true").lower() == "true"
+RESILIENCE_DEADLINES = os.getenv("RESILIENCE_DEADLINES", "transformation=20,summarization=45,generation=30,embeddings=10,ingest_embeddings=120,vector_query=5,upsert=60")
+RESILIENCE_MAX_ATTEMPTS = int(os.getenv("RESILIENCE_MAX_ATTEMPTS", "3"))
+RESILIENCE_BACKOFF_BASE_SECONDS = float(os.getenv("RESILIENCE_BACKOFF_BASE_SECONDS", "0.25"))
+RESILIENCE_BACKOFF_MAX_SECONDS = float(os.getenv("RESILIENCE_BACKOFF_MAX_SECONDS", "4"))
+RESILIENCE_MAX_WORKERS = int(os.getenv("RESILIENCE_MAX_WORKERS", "64"))
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+HEDGED_STAGES = os.getenv("HEDGED_STAGES", "embeddings,vector_query")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+
+# Credentials are validated when a client is first created rather than at
+# import time, so importing the package needs neither keys nor network access
+def require_openai_api_key():
+    if not OPENAI_API_KEY:
+        raise ValueError("OpenAI API Key is not set in the environment.")
+
+def require_pinecone_settings():
+    if not PINECONE_API_KEY or not PINECONE_INDEX:
+        raise ValueError("Pinecone API Key or Index is not set in the environment.")
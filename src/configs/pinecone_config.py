@@ -2,34 +2,63 @@
 from pinecone import Pinecone, ServerlessSpec
 from langchain_pinecone import Pinecone as LangchainPinecone
 from langchain_openai import OpenAIEmbeddings
-from langchain.tools.retriever import create_retriever_tool
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.resilience import ResilientEmbeddings
 from .config import PINECONE_API_KEY, PINECONE_INDEX, PINECONE_ENVIRONMENT, PINECONE_DIMENSION, PINECONE_CLOUD, PINECONE_REGION, OPENAI_API_KEY
+from .config import EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_DISK_SIZE
+from .config import RETRIEVAL_MAX_CONCURRENCY, RESILIENCE_ENABLED, require_openai_api_key, require_pinecone_settings
 
-# Initialize Pinecone client
-pc = Pinecone(
-    api_key=PINECONE_API_KEY,
-    environment=PINECONE_ENVIRONMENT
-)
-
-# Check if the index exists, otherwise create it
-if PINECONE_INDEX not in pc.list_indexes().names():
-    pc.create_index(
-        name=PINECONE_INDEX,
-        dimension=PINECONE_DIMENSION,
-        metric='cosine',
-        spec=ServerlessSpec(
-            cloud=PINECONE_CLOUD,
-            region=PINECONE_REGION
-        )
+# These factories are registered with src.providers, which calls each of them
+# at most once per process on first use.
+
+def create_pinecone_client():
+    require_pinecone_settings()
+
+    # Initialize Pinecone client
+    return Pinecone(
+        api_key=PINECONE_API_KEY,
+        environment=PINECONE_ENVIRONMENT
     )
 
-pinecone_index = pc.Index(PINECONE_INDEX)
+def create_pinecone_index(pc):
+    # Check if the index exists, otherwise create it
+    if PINECONE_INDEX not in pc.list_indexes().names():
+        pc.create_index(
+            name=PINECONE_INDEX,
+            dimension=PINECONE_DIMENSION,
+            metric='cosine',
+            spec=ServerlessSpec(
+                cloud=PINECONE_CLOUD,
+                region=PINECONE_REGION
+            )
+        )
+
+    return pc.Index(PINECONE_INDEX, pool_threads=RETRIEVAL_MAX_CONCURRENCY)
 
-# Initialize embeddings
-embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model='text-embedding-3-large')
+def create_embeddings(http_client=None, http_async_client=None):
+    require_openai_api_key()
+
+    # Initialize embeddings, memoized so repeated queries cost no embedding call.
+    # Cache misses go to the API under the "embeddings" resilience policy,
+    # which then owns retries instead of the OpenAI client.
+    embedding_cache = EmbeddingCache(
+        max_entries=EMBEDDING_CACHE_SIZE,
+        db_path=EMBEDDING_CACHE_PATH,
+        max_disk_entries=EMBEDDING_CACHE_DISK_SIZE
+    )
+    embeddings = OpenAIEmbeddings(
+        api_key=OPENAI_API_KEY,
+        model=EMBEDDING_MODEL,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=0 if RESILIENCE_ENABLED else 2
+    )
+    return CachedEmbeddings(
+        ResilientEmbeddings(embeddings) if RESILIENCE_ENABLED else embeddings,
+        model_name=EMBEDDING_MODEL,
+        cache=embedding_cache
+    )
 
-# Create LangChain Pinecone vector store from existing index
-vector_store = LangchainPinecone.from_existing_index(
-    index_name=PINECONE_INDEX,
-    embedding=embeddings
-)
+def create_vector_store(pinecone_index, embeddings):
+    # Create LangChain Pinecone vector store on the shared index handle
+    return LangchainPinecone(index=pinecone_index, embedding=embeddings)
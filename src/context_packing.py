@@ -0,0 +1,74 @@
+# src/context_packing.py
+import hashlib
+import logging
+from typing import List
+import numpy as np
+from src.token_counting import count_tokens
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def document_key(document: dict) -> str:
+    # Vector ids identify chunks across sub-queries; fall back to a content hash
+    return document.get("id") or hashlib.sha256(document["content"].encode("utf-8")).hexdigest()
+
+def deduplicate(retrieved_documents: List[List[dict]]) -> List[dict]:
+    # Flatten the per-sub-query results, keeping each chunk once under the
+    # sub-query that scored it highest
+    best = {}
+    for sub_query_index, documents in enumerate(retrieved_documents):
+        for document in documents:
+            key = document_key(document)
+            if key not in best or document["score"] > best[key]["score"]:
+                best[key] = {**document, "sub_query_index": sub_query_index}
+    return list(best.values())
+
+def mmr_order(candidates: List[dict], embeddings, mmr_lambda: float) -> List[dict]:
+    # Maximal marginal relevance: trade the retrieval score against similarity
+    # to the chunks already selected
+    vectors = np.asarray(embeddings.embed_documents([candidate["content"] for candidate in candidates]), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    similarity = vectors @ vectors.T
+    relevance = np.asarray([candidate["score"] for candidate in candidates], dtype=np.float32)
+
+    selected = []
+    remaining = list(range(len(candidates)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return [candidates[i] for i in selected]
+
+def pack_context(retrieved_documents: List[List[dict]], token_budget: int, use_mmr: bool = False, mmr_lambda: float = 0.5, embeddings=None) -> List[List[dict]]:
+    # Returns the packed chunks grouped per sub-query, in sub-query order, with
+    # the total token count of all groups kept within token_budget
+    candidates = deduplicate(retrieved_documents)
+    if use_mmr and embeddings is not None and len(candidates) > 1:
+        try:
+            candidates = mmr_order(candidates, embeddings, mmr_lambda)
+        except Exception as e:
+            logger.error(f"Error during MMR ranking, falling back to score order: {str(e)}")
+            candidates.sort(key=lambda candidate: candidate["score"], reverse=True)
+    else:
+        candidates.sort(key=lambda candidate: candidate["score"], reverse=True)
+
+    packed = [[] for _ in retrieved_documents]
+    used_tokens = 0
+    for candidate in candidates:
+        tokens = count_tokens(candidate["content"])
+        # Skip chunks that do not fit; a smaller, lower-ranked one still might
+        if used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        packed[candidate["sub_query_index"]].append(candidate)
+
+    logger.info(
+        "Packed %d of %d unique chunks (%d retrieved) into %d/%d tokens.",
+        sum(len(group) for group in packed), len(candidates),
+        sum(len(documents) for documents in retrieved_documents), used_tokens, token_budget
+    )
+    return packed
@@ -0,0 +1,78 @@
+# src/embedding_cache.py
+import hashlib
+import logging
+from array import array
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+from src.lru_store import LRUStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    # Collapse whitespace and case so trivially rephrased inputs share an entry
+    return " ".join(text.split()).casefold()
+
+def make_cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache(LRUStore):
+    # LRU of embedding vectors, optionally backed by a SQLite file so entries
+    # survive process restarts. Vectors are stored as packed float32.
+
+    def __init__(self, max_entries: int = 10000, db_path: Optional[str] = None, max_disk_entries: int = 100000, ttl_seconds: Optional[float] = None):
+        super().__init__(
+            "embeddings",
+            max_entries=max_entries,
+            db_path=db_path,
+            max_disk_entries=max_disk_entries,
+            ttl_seconds=ttl_seconds,
+            encode=lambda vector: array("f", vector).tobytes(),
+            decode=lambda blob: array("f", blob).tolist(),
+        )
+
+class CachedEmbeddings(Embeddings):
+    # Wraps an Embeddings model so cached texts cost no API call and all the
+    # remaining texts of one request are embedded in a single batched call.
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def _lookup(self, texts: List[str]):
+        keys = [make_cache_key(self.model_name, text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+
+        # Embed each distinct missing text once
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            logger.info(f"Embedding {len(missing)} of {len(texts)} texts (cache: {self.cache.stats()})")
+        return keys, vectors, missing
+
+    def _merge(self, keys, vectors, missing, new_vectors) -> List[List[float]]:
+        for key, vector in zip(missing.keys(), new_vectors):
+            self.cache.put(key, vector)
+        computed = dict(zip(missing.keys(), new_vectors))
+        return [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        if not missing:
+            return vectors
+        return self._merge(keys, vectors, missing, self.embeddings.embed_documents(list(missing.values())))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        if not missing:
+            return vectors
+        return self._merge(keys, vectors, missing, await self.embeddings.aembed_documents(list(missing.values())))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,246 @@
+# src/ingestion.py
+# Loads a corpus into the configured vector store.
+#
+#   python -m src.ingestion docs/                 # every text file under a directory
+#   python -m src.ingestion corpus.jsonl          # {"text": ..., "source": ..., "metadata": {...}} per line
+#
+# Chunks are written to the record's "namespace", else the namespace of its
+# metadata content_type when CONTENT_TYPE_NAMESPACES is on, else --namespace.
+#
+# Documents are streamed and chunked lazily, chunks are embedded in large
+# batches with a bounded number of requests in flight, and each embedded batch
+# is upserted from its own worker so embedding and upserts overlap. Chunk ids
+# are content hashes, so re-running over an unchanged corpus embeds nothing.
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.configs.config import VECTOR_STORE_BACKEND, INGESTION_CHUNK_SIZE, INGESTION_CHUNK_OVERLAP, CONTENT_TYPE_NAMESPACES
+from src.configs.config import INGESTION_EMBED_BATCH_SIZE, INGESTION_MAX_IN_FLIGHT, INGESTION_UPSERT_BATCH_SIZE, INGESTION_FILE_EXTENSIONS
+from src.embedding_cache import CachedEmbeddings
+from src.local_vector_store import NAMESPACE_KEY
+from src.providers import get_embeddings, get_pinecone_index, get_vector_store
+from src.resilience import ResilientEmbeddings, resilient_call
+from src.retrieval import content_type_namespace
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def iter_documents(path: str, extensions: Iterable[str] = INGESTION_FILE_EXTENSIONS.split(",")) -> Iterator[dict]:
+    # Yields {"source", "text", "metadata"} one document at a time
+    if os.path.isdir(path):
+        extensions = tuple(extension.strip().lower() for extension in extensions if extension.strip())
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.lower().endswith(extensions):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    with open(file_path, encoding="utf-8") as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.error(f"Error reading {file_path}: {str(e)}")
+                    continue
+                yield {"source": os.path.relpath(file_path, path), "text": text, "metadata": {}, "namespace": None}
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping invalid JSON on line {line_number}: {str(e)}")
+                continue
+            text = record.get("text") or record.get("content")
+            if not text:
+                logger.error(f"Skipping line {line_number}: missing 'text'")
+                continue
+            source = str(record.get("source") or record.get("id") or f"{os.path.basename(path)}:{line_number}")
+            yield {"source": source, "text": text, "metadata": record.get("metadata") or {}, "namespace": record.get("namespace")}
+
+def chunk_id(source: str, text: str) -> str:
+    # Unchanged chunks keep their id across runs, wherever they move in the document
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+def document_namespace(document: dict, default_namespace: Optional[str] = None) -> Optional[str]:
+    if document.get("namespace"):
+        return document["namespace"]
+    content_type = document["metadata"].get("content_type")
+    if CONTENT_TYPE_NAMESPACES and content_type:
+        return content_type_namespace(content_type)
+    return default_namespace
+
+def iter_chunks(documents: Iterable[dict], chunk_size: int = INGESTION_CHUNK_SIZE, chunk_overlap: int = INGESTION_CHUNK_OVERLAP, default_namespace: Optional[str] = None) -> Iterator[dict]:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for document in documents:
+        namespace = document_namespace(document, default_namespace)
+        for text in splitter.split_text(document["text"]):
+            yield {
+                "id": chunk_id(document["source"], text),
+                "text": text,
+                "metadata": {**document["metadata"], "source": document["source"]},
+                "namespace": namespace,
+            }
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+class LocalVectorStoreWriter:
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def existing_ids(self, chunks: List[dict]) -> set:
+        return {document.id for document in self.vector_store.get_by_ids([chunk["id"] for chunk in chunks])}
+
+    def upsert(self, chunks: List[dict], vectors: List[List[float]]) -> None:
+        # The store serializes writes to its files, so one call per batch is
+        # enough; namespaces live in a reserved metadata key
+        self.vector_store.add_embeddings(
+            [chunk["text"] for chunk in chunks], vectors,
+            metadatas=[{**chunk["metadata"], NAMESPACE_KEY: chunk["namespace"]} if chunk["namespace"] else chunk["metadata"] for chunk in chunks],
+            ids=[chunk["id"] for chunk in chunks]
+        )
+
+class PineconeWriter:
+    # Writes straight to the index in the layout LangchainPinecone reads back,
+    # with the chunk text under the "text" metadata key
+    def __init__(self, index, upsert_batch_size: int = INGESTION_UPSERT_BATCH_SIZE):
+        self.index = index
+        self.upsert_batch_size = upsert_batch_size
+
+    def existing_ids(self, chunks: List[dict]) -> set:
+        ids_by_namespace = defaultdict(list)
+        for chunk in chunks:
+            ids_by_namespace[chunk["namespace"] or ""].append(chunk["id"])
+        existing = set()
+        for namespace, ids in ids_by_namespace.items():
+            for batch in batched(ids, self.upsert_batch_size):
+                existing.update(self.index.fetch(ids=batch, namespace=namespace).vectors.keys())
+        return existing
+
+    def upsert(self, chunks: List[dict], vectors: List[List[float]]) -> None:
+        records_by_namespace = defaultdict(list)
+        for chunk, vector in zip(chunks, vectors):
+            records_by_namespace[chunk["namespace"] or ""].append(
+                {"id": chunk["id"], "values": vector, "metadata": {**chunk["metadata"], "text": chunk["text"]}}
+            )
+        # Pinecone caps the request size, so large embedding batches go out in pieces
+        for namespace, records in records_by_namespace.items():
+            for batch in batched(records, self.upsert_batch_size):
+                self.index.upsert(vectors=batch, namespace=namespace)
+
+def create_writer():
+    if VECTOR_STORE_BACKEND == "local":
+        return LocalVectorStoreWriter(get_vector_store())
+    return PineconeWriter(get_pinecone_index())
+
+def ingest(
+    chunks: Iterable[dict],
+    writer,
+    embeddings,
+    embed_batch_size: int = INGESTION_EMBED_BATCH_SIZE,
+    max_in_flight: int = INGESTION_MAX_IN_FLIGHT,
+    force: bool = False
+) -> dict:
+    # Returns counts and throughput. A batch that fails to embed or upsert is
+    # logged and counted, and the remaining batches carry on.
+    stats = {"chunks": 0, "skipped": 0, "embedded": 0, "failed": 0}
+    stats_lock = threading.Lock()
+    # Bounds the batches being embedded or upserted, and with it how far the
+    # reader runs ahead of the workers
+    in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+    start = time.perf_counter()
+    submitted = 0
+
+    def process(batch: List[dict]) -> None:
+        try:
+            vectors = embeddings.embed_documents([chunk["text"] for chunk in batch])
+            # Chunk ids are content hashes, so a retried upsert is idempotent
+            resilient_call("upsert", writer.upsert, batch, vectors)
+            with stats_lock:
+                stats["embedded"] += len(batch)
+        except Exception as e:
+            logger.error(f"Error ingesting a batch of {len(batch)} chunks: {str(e)}")
+            with stats_lock:
+                stats["failed"] += len(batch)
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="ingestion") as executor:
+        for batch in batched(chunks, embed_batch_size):
+            # Repeated chunks within a batch are embedded once
+            batch = list({chunk["id"]: chunk for chunk in batch}.values())
+            with stats_lock:
+                stats["chunks"] += len(batch)
+            if not force:
+                try:
+                    existing = writer.existing_ids(batch)
+                except Exception as e:
+                    logger.error(f"Error checking for existing chunks, re-embedding the batch: {str(e)}")
+                    existing = set()
+                batch = [chunk for chunk in batch if chunk["id"] not in existing]
+                with stats_lock:
+                    stats["skipped"] += len(existing)
+            if not batch:
+                continue
+
+            in_flight.acquire()
+            executor.submit(process, batch)
+            submitted += 1
+            if submitted % 10 == 0:
+                logger.info(f"Ingestion progress: {stats} ({stats['chunks'] / (time.perf_counter() - start):.1f} chunks/sec)")
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+def ingestion_embeddings(embeddings):
+    # Corpus chunks would only churn the query embedding cache, so bypass it.
+    # Bulk batches get their own "ingest_embeddings" policy: a longer deadline
+    # than interactive queries, and no hedging, which would pay for every
+    # slow batch twice.
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    if isinstance(embeddings, ResilientEmbeddings):
+        embeddings = ResilientEmbeddings(embeddings.embeddings, stage="ingest_embeddings")
+    return embeddings
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chunk, embed and upsert a corpus into the configured vector store.")
+    parser.add_argument("path", help="Directory of text files or a JSONL file.")
+    parser.add_argument("--extensions", default=INGESTION_FILE_EXTENSIONS, help="Comma-separated file extensions to read from a directory.")
+    parser.add_argument("--chunk-size", type=int, default=INGESTION_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=INGESTION_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=INGESTION_EMBED_BATCH_SIZE, help="Chunks per embedding request.")
+    parser.add_argument("--max-in-flight", type=int, default=INGESTION_MAX_IN_FLIGHT, help="Batches embedded or upserted at once.")
+    parser.add_argument("--namespace", help="Namespace for chunks that do not set one.")
+    parser.add_argument("--force", action="store_true", help="Re-embed chunks that are already in the store.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    embeddings = ingestion_embeddings(get_embeddings())
+
+    documents = iter_documents(args.path, args.extensions.split(","))
+    chunks = iter_chunks(documents, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, default_namespace=args.namespace)
+    stats = ingest(chunks, create_writer(), embeddings, embed_batch_size=args.batch_size, max_in_flight=args.max_in_flight, force=args.force)
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
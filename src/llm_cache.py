@@ -0,0 +1,98 @@
+# src/llm_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Optional
+from src.configs.config import LLM_CACHE_ENABLED, LLM_CACHE_DISABLED_CHAINS
+from src.lru_store import LRUStore
+from src.providers import get_llm_cache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Exact-match cache for deterministic (temperature 0) chains. Entries are keyed
+# on the model, a hash of the prompt template and the exact input, and hold the
+# chain's parsed, JSON-serializable result.
+
+def make_llm_cache_key(model_name: str, template: str, inputs: Any) -> str:
+    template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{model_name}\x00{template_hash}\x00{payload}".encode("utf-8")).hexdigest()
+
+class LLMCache(LRUStore):
+    # LRU of chain results in front of an optional SQLite file; results are
+    # stored as JSON and expire after ttl_seconds.
+
+    def __init__(self, max_entries: int = 1000, db_path: Optional[str] = None, max_disk_entries: int = 100000, ttl_seconds: Optional[float] = 604800):
+        super().__init__(
+            "llm_responses",
+            max_entries=max_entries,
+            db_path=db_path,
+            max_disk_entries=max_disk_entries,
+            ttl_seconds=ttl_seconds,
+            encode=json.dumps,
+            decode=json.loads,
+        )
+
+_disabled_chains = {name.strip() for name in LLM_CACHE_DISABLED_CHAINS.split(",") if name.strip()}
+
+def is_cache_enabled(chain_name: str) -> bool:
+    return LLM_CACHE_ENABLED and chain_name not in _disabled_chains
+
+def _cache_for(chain_name: str) -> Optional[LLMCache]:
+    if not is_cache_enabled(chain_name):
+        return None
+    try:
+        return get_llm_cache()
+    except Exception as e:
+        logger.error(f"Error opening the LLM cache: {str(e)}")
+        return None
+
+def cached_llm_call(chain_name: str, model_name: str, template: str, inputs: Any, compute):
+    # Returns the cached result for this model, template and input, or calls
+    # compute() and stores what it returns. Exceptions from compute() are not
+    # cached and propagate to the caller's fallback handling.
+    cache = _cache_for(chain_name)
+    if cache is None:
+        return compute()
+
+    key = make_llm_cache_key(model_name, template, inputs)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.error(f"Error reading the LLM cache for {chain_name}: {str(e)}")
+        cached = None
+    if cached is not None:
+        logger.info(f"LLM cache hit for {chain_name}")
+        return cached
+
+    result = compute()
+    try:
+        cache.put(key, result)
+    except Exception as e:
+        logger.error(f"Error writing the LLM cache for {chain_name}: {str(e)}")
+    return result
+
+async def acached_llm_call(chain_name: str, model_name: str, template: str, inputs: Any, acompute):
+    # Async counterpart of cached_llm_call; SQLite access runs off the event loop
+    cache = _cache_for(chain_name)
+    if cache is None:
+        return await acompute()
+
+    key = make_llm_cache_key(model_name, template, inputs)
+    try:
+        cached = await asyncio.to_thread(cache.get, key)
+    except Exception as e:
+        logger.error(f"Error reading the LLM cache for {chain_name}: {str(e)}")
+        cached = None
+    if cached is not None:
+        logger.info(f"LLM cache hit for {chain_name}")
+        return cached
+
+    result = await acompute()
+    try:
+        await asyncio.to_thread(cache.put, key, result)
+    except Exception as e:
+        logger.error(f"Error writing the LLM cache for {chain_name}: {str(e)}")
+    return result
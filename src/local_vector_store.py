@@ -0,0 +1,462 @@
+# src/local_vector_store.py
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+METADATA_FILE = "metadata.jsonl"
+OFFSETS_FILE = "offsets.bin"
+ROWS_FILE = "rows.jsonl"
+
+# Bytes of float32 scores input per step of a search; bounds the memory a query
+# touches at once whatever the dimension
+SEARCH_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Metadata key that holds a row's namespace; rows without one are in the default namespace
+NAMESPACE_KEY = "namespace"
+
+# Stands for a metadata field the row does not have
+_ABSENT = object()
+
+class FieldIndex:
+    # Columnar index of one metadata field, kept in step with every write: an
+    # int32 code per row for scalar values (MISSING when the row lacks the
+    # field, LIST when it holds a list) and, for list values such as keywords,
+    # the set of rows holding each element. Filters become numpy comparisons
+    # instead of a Python pass over every row's metadata.
+    MISSING = -1
+    LIST = -2
+
+    def __init__(self):
+        self.codes = np.full(1024, self.MISSING, dtype=np.int32)
+        self.value_codes = {}
+        self.list_rows = {}
+        self._list_arrays = {}
+
+    def _code(self, value, create: bool = False) -> Optional[int]:
+        try:
+            code = self.value_codes.get(value)
+        except TypeError:  # unhashable values are never matched
+            return None
+        if code is None and create:
+            code = self.value_codes[value] = len(self.value_codes)
+        return code
+
+    def _grow(self, size: int) -> None:
+        # Capacity doubles, so appending rows costs amortized O(1) per row
+        if size > len(self.codes):
+            codes = np.full(max(size, 2 * len(self.codes)), self.MISSING, dtype=np.int32)
+            codes[:len(self.codes)] = self.codes
+            self.codes = codes
+
+    def set(self, row: int, old_value, new_value) -> None:
+        # old_value/new_value are _ABSENT when the row lacks the field
+        self._grow(row + 1)
+        if isinstance(old_value, list):
+            for item in old_value:
+                code = self._code(item)
+                if code in self.list_rows:
+                    self.list_rows[code].discard(row)
+                    self._list_arrays.pop(code, None)
+
+        if new_value is _ABSENT:
+            self.codes[row] = self.MISSING
+        elif isinstance(new_value, list):
+            self.codes[row] = self.LIST
+            for item in new_value:
+                code = self._code(item, create=True)
+                if code is not None:
+                    self.list_rows.setdefault(code, set()).add(row)
+                    self._list_arrays.pop(code, None)
+        else:
+            code = self._code(new_value, create=True)
+            self.codes[row] = self.MISSING if code is None else code
+
+    def present(self, count: int) -> np.ndarray:
+        self._grow(count)
+        return self.codes[:count] != self.MISSING
+
+    def equals(self, value, count: int) -> np.ndarray:
+        code = self._code(value)
+        if code is None:
+            return np.zeros(count, dtype=bool)
+        self._grow(count)
+        mask = self.codes[:count] == code
+        if code in self.list_rows:
+            rows = self._list_arrays.get(code)
+            if rows is None:
+                rows = self._list_arrays[code] = np.fromiter(self.list_rows[code], dtype=np.int64, count=len(self.list_rows[code]))
+            mask[rows[rows < count]] = True
+        return mask
+
+    def any_of(self, values, count: int) -> np.ndarray:
+        mask = np.zeros(count, dtype=bool)
+        for value in values:
+            mask |= self.equals(value, count)
+        return mask
+
+class LocalVectorStore(VectorStore):
+    # Vector store kept in a directory on local disk:
+    #   vectors.bin     unit-normalized rows, float32 or int8-quantized
+    #   scales.bin      per-row float32 dequantization scales (int8 only)
+    #   metadata.jsonl  one {"id", "text", "metadata"} record per write
+    #   offsets.bin     uint64 offset of each row's current record in metadata.jsonl
+    #   rows.jsonl      {"row", "id", "metadata"} per write, without the text, so
+    #                   the id index loads without reading every chunk
+    # Vectors are read through np.memmap in fixed-size blocks, so a search never
+    # loads the whole matrix into RAM. Scores are cosine similarities.
+
+    def __init__(self, path: str, embedding: Embeddings, dtype: str = "float32"):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported local vector store dtype: {dtype}")
+
+        self.path = path
+        self.embedding = embedding
+        self._lock = threading.RLock()
+        self._id_index = None  # id -> row, built on the first upsert or filtered search
+        self._row_metadata = None  # metadata per row, for filtered searches
+        self._field_indexes = {}  # field -> FieldIndex, built on first filter by that field
+        os.makedirs(path, exist_ok=True)
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            self.dtype = manifest["dtype"]
+            self.dimension = manifest["dimension"]
+            self.count = manifest["count"]
+            # Whether any row has a namespace; unknown for older stores
+            self.namespaced = manifest.get("namespaced", True)
+        else:
+            self.dtype = dtype
+            self.dimension = None  # set by the first write
+            self.count = 0
+            self.namespaced = False
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write_manifest(self) -> None:
+        manifest_path = self._file(MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({"dtype": self.dtype, "dimension": self.dimension, "count": self.count, "namespaced": self.namespaced}, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _vectors(self, count: int):
+        return np.memmap(self._file(VECTORS_FILE), dtype=np.dtype(self.dtype), mode="r", shape=(count, self.dimension))
+
+    def _scales(self, count: int):
+        return np.memmap(self._file(SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype == "float32":
+            return vectors.astype(np.float32), None
+
+        # Symmetric per-row int8 quantization
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def _read_records(self, rows: Iterable[int]) -> List[dict]:
+        rows = list(rows)
+        if not rows:
+            return []
+        offsets = np.memmap(self._file(OFFSETS_FILE), dtype=np.uint64, mode="r", shape=(self.count,))
+        records = []
+        with open(self._file(METADATA_FILE), "rb") as f:
+            for row in rows:
+                f.seek(int(offsets[row]))
+                records.append(json.loads(f.readline()))
+        return records
+
+    def _load_id_index(self) -> dict:
+        if self._id_index is None:
+            id_index, row_metadata = {}, [None] * self.count
+            rows_path = self._file(ROWS_FILE)
+            if os.path.exists(rows_path):
+                # Later lines update earlier ones; rows past the manifest count
+                # belong to a write that did not finish
+                for entry in self._read_rows_file(rows_path):
+                    if entry["row"] < self.count:
+                        id_index[entry["id"]] = entry["row"]
+                        row_metadata[entry["row"]] = entry["metadata"]
+            if len(id_index) < self.count:
+                id_index, row_metadata = self._rebuild_rows_file()
+            self._id_index, self._row_metadata = id_index, row_metadata
+        return self._id_index
+
+    def _read_rows_file(self, rows_path: str) -> List[dict]:
+        with open(rows_path, "rb") as f:
+            data = f.read().rstrip(b"\n")
+        if not data:
+            return []
+        try:
+            # One parse of the whole file as a JSON array is about twice as fast
+            # as a parse per line; json.dumps never writes a raw newline
+            return json.loads(b"[" + data.replace(b"\n", b",") + b"]")
+        except json.JSONDecodeError:
+            # A write cut short leaves a partial last line
+            entries = []
+            for line in data.split(b"\n"):
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+            return entries
+
+    def _rebuild_rows_file(self) -> Tuple[dict, list]:
+        # Stores written before rows.jsonl existed: read the records once, in
+        # blocks, and write the sidecar so later loads skip the chunk text
+        logger.info(f"Building {ROWS_FILE} for {self.count} rows in {self.path}")
+        id_index, row_metadata = {}, []
+        with open(self._file(ROWS_FILE) + ".tmp", "wb") as f:
+            for start in range(0, self.count, 10000):
+                records = self._read_records(range(start, min(start + 10000, self.count)))
+                for row, record in enumerate(records, start=start):
+                    id_index[record["id"]] = row
+                    row_metadata.append(record["metadata"])
+                    f.write(json.dumps({"row": row, "id": record["id"], "metadata": record["metadata"]}).encode("utf-8") + b"\n")
+        os.replace(self._file(ROWS_FILE) + ".tmp", self._file(ROWS_FILE))
+        return id_index, row_metadata
+
+    def _field_index(self, field: str) -> FieldIndex:
+        index = self._field_indexes.get(field)
+        if index is None:
+            index = FieldIndex()
+            for row, metadata in enumerate(self._row_metadata):
+                value = metadata.get(field, _ABSENT)
+                if value is not _ABSENT:
+                    index.set(row, _ABSENT, value)
+            self._field_indexes[field] = index
+        return index
+
+    def _condition_mask(self, field: str, condition, count: int) -> np.ndarray:
+        # Pinecone filter semantics: a list-valued field matches if any element
+        # does, and a row without the field matches no condition on it
+        index = self._field_index(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = index.present(count)
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                mask &= index.equals(operand, count)
+            elif operator == "$ne":
+                mask &= ~index.equals(operand, count)
+            elif operator == "$in":
+                mask &= index.any_of(operand, count)
+            elif operator == "$nin":
+                mask &= ~index.any_of(operand, count)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+        return mask
+
+    def _metadata_mask(self, filter: dict, count: int) -> np.ndarray:
+        mask = np.ones(count, dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._metadata_mask(clause, count)
+            elif key == "$or":
+                any_clause = np.zeros(count, dtype=bool)
+                for clause in condition:
+                    any_clause |= self._metadata_mask(clause, count)
+                mask &= any_clause
+            else:
+                mask &= self._condition_mask(key, condition, count)
+        return mask
+
+    def _filter_mask(self, filter: Optional[dict], namespace: Optional[str]) -> Optional[np.ndarray]:
+        # Boolean mask of the rows a search may return, or None to search every
+        # row. Like Pinecone, a search without a namespace only sees the
+        # default namespace, i.e. rows written without one.
+        if not filter and not namespace and not self.namespaced:
+            return None
+        with self._lock:
+            self._load_id_index()
+            count = self.count
+            namespaces = self._field_index(NAMESPACE_KEY)
+            in_namespace = namespaces.present(count)
+            self.namespaced = bool(in_namespace.any())
+            if namespace:
+                mask = namespaces.equals(namespace, count)
+            elif self.namespaced:
+                mask = ~in_namespace
+            else:
+                mask = None
+            if filter:
+                metadata_mask = self._metadata_mask(filter, count)
+                mask = metadata_mask if mask is None else mask & metadata_mask
+            return mask
+
+    def add_embeddings(self, texts: Iterable[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        # When an id repeats within one call, its last occurrence wins
+        latest = {id_: i for i, id_ in enumerate(ids)}
+        if len(latest) < len(ids):
+            keep = sorted(latest.values())
+            texts, embeddings = [texts[i] for i in keep], [embeddings[i] for i in keep]
+            metadatas, ids = [metadatas[i] for i in keep], [ids[i] for i in keep]
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dim vectors, got {vectors.shape[1]}")
+
+            encoded, scales = self._encode(vectors)
+            self.namespaced = self.namespaced or any(NAMESPACE_KEY in metadata for metadata in metadatas)
+            id_index = self._load_id_index()
+
+            # Every write appends a metadata record; existing ids are updated in place
+            with open(self._file(METADATA_FILE), "ab") as f:
+                offsets = []
+                for text, metadata, id_ in zip(texts, metadatas, ids):
+                    offsets.append(f.tell())
+                    f.write(json.dumps({"id": id_, "text": text, "metadata": metadata}).encode("utf-8") + b"\n")
+
+            new_rows = []
+            rows = []
+            for i, id_ in enumerate(ids):
+                row = id_index.get(id_)
+                if row is None:
+                    row = self.count + len(new_rows)
+                    id_index[id_] = row
+                    old_metadata = {}
+                    self._row_metadata.append(metadatas[i])
+                    new_rows.append(i)
+                else:
+                    old_metadata = self._row_metadata[row]
+                    self._row_metadata[row] = metadatas[i]
+                    self._overwrite_row(row, encoded[i], None if scales is None else scales[i], offsets[i])
+                rows.append(row)
+                for field, index in self._field_indexes.items():
+                    index.set(row, old_metadata.get(field, _ABSENT), metadatas[i].get(field, _ABSENT))
+
+            with open(self._file(ROWS_FILE), "ab") as f:
+                f.write(b"".join(
+                    json.dumps({"row": row, "id": id_, "metadata": metadata}).encode("utf-8") + b"\n"
+                    for row, id_, metadata in zip(rows, ids, metadatas)
+                ))
+
+            if new_rows:
+                with open(self._file(VECTORS_FILE), "ab") as f:
+                    f.write(encoded[new_rows].tobytes())
+                if scales is not None:
+                    with open(self._file(SCALES_FILE), "ab") as f:
+                        f.write(scales[new_rows].tobytes())
+                with open(self._file(OFFSETS_FILE), "ab") as f:
+                    f.write(np.asarray([offsets[i] for i in new_rows], dtype=np.uint64).tobytes())
+                self.count += len(new_rows)
+
+            self._write_manifest()
+        return ids
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        with self._lock:
+            id_index = self._load_id_index()
+            records = self._read_records(id_index[id_] for id_ in ids if id_ in id_index)
+        return [Document(id=record["id"], page_content=record["text"], metadata=record["metadata"]) for record in records]
+
+    def _overwrite_row(self, row: int, vector: np.ndarray, scale, offset: int) -> None:
+        vectors = np.memmap(self._file(VECTORS_FILE), dtype=np.dtype(self.dtype), mode="r+", shape=(self.count, self.dimension))
+        vectors[row] = vector
+        vectors.flush()
+        if scale is not None:
+            scales = np.memmap(self._file(SCALES_FILE), dtype=np.float32, mode="r+", shape=(self.count,))
+            scales[row] = scale
+            scales.flush()
+        offsets = np.memmap(self._file(OFFSETS_FILE), dtype=np.uint64, mode="r+", shape=(self.count,))
+        offsets[row] = offset
+        offsets.flush()
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas=metadatas, ids=ids)
+
+    def _top_k(self, embedding: List[float], k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        count = self.count if mask is None else min(self.count, len(mask))
+        if count == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+
+        vectors = self._vectors(count)
+        scales = self._scales(count) if self.dtype == "int8" else None
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        block_rows = max(1, SEARCH_BLOCK_BYTES // (4 * self.dimension))
+        for start in range(0, count, block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            scores = block @ query
+            if scales is not None:
+                scores *= scales[start:start + block_rows]
+            if mask is not None:
+                scores[~mask[start:start + len(block)]] = -np.inf
+
+            # Merge this block's candidates into the running top-k
+            rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[keep], scores[keep]
+            best_rows, best_scores = rows, scores
+
+        order = np.argsort(-best_scores)
+        order = order[np.isfinite(best_scores[order])]
+        return best_rows[order], best_scores[order]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, namespace: Optional[str] = None, **kwargs) -> List[Tuple[Document, float]]:
+        # filter takes Pinecone-style metadata conditions ($eq, $ne, $in, $nin,
+        # $and, $or); namespace selects rows written with that namespace
+        rows, scores = self._top_k(embedding, k, self._filter_mask(filter, namespace))
+        records = self._read_records(rows)
+        return [
+            (Document(id=record["id"], page_content=record["text"], metadata=record["metadata"]), float(score))
+            for record, score in zip(records, scores)
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, path: str = "data/vector_store", dtype: str = "float32", **kwargs) -> "LocalVectorStore":
+        store = cls(path, embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
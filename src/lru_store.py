@@ -0,0 +1,184 @@
+# src/lru_store.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class LRUStore:
+    # In-memory LRU in front of an optional SQLite table. Both layers evict the
+    # least recently used entries past their size limit; with ttl_seconds set,
+    # older entries are treated as misses and dropped. encode/decode convert
+    # values to and from what is stored in the table's value column.
+    #
+    # The memory LRU and the SQLite connection have separate locks, so a
+    # memory hit never waits on disk I/O. Disk upkeep is amortized: rows are
+    # evicted in batches once the table is evict_batch past its limit, expired
+    # rows are swept at most every sweep_seconds, and last_access updates from
+    # disk hits are buffered and written with the next put.
+
+    COLUMNS = ["key", "value", "created_at", "last_access"]
+
+    def __init__(
+        self,
+        table: str,
+        max_entries: int = 1000,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 100000,
+        ttl_seconds: Optional[float] = None,
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+        evict_batch: Optional[int] = None,
+        sweep_seconds: float = 60,
+        access_flush_size: int = 256,
+    ):
+        self.table = table
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.encode = encode
+        self.decode = decode
+        self.evict_batch = evict_batch or max(1, max_disk_entries // 20)
+        self.sweep_seconds = sweep_seconds
+        self.access_flush_size = access_flush_size
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._disk_count = 0
+        self._last_sweep = 0.0
+        self._pending_access = {}
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            # WAL plus a busy timeout lets several app processes share the file
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+            if columns and columns != self.COLUMNS:
+                # A cache table from an older layout; start it over
+                logger.warning(f"Rebuilding cache table {table} in {db_path}")
+                self._conn.execute(f"DROP TABLE {table}")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created_at ON {table} (created_at)")
+            self._conn.commit()
+            self._disk_count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory_put(key, *entry)
+            self.hits += 1
+            self.disk_hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, value, now)
+        self._disk_put(key, value, now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _memory_put(self, key: str, value: Any, created_at: float) -> None:
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float):
+        if self._conn is None:
+            return None
+        with self._db_lock:
+            row = self._conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], now):
+                # Left for the next sweep; a miss either way
+                return None
+            self._pending_access[key] = now
+            if len(self._pending_access) >= self.access_flush_size:
+                self._flush_access()
+                self._conn.commit()
+        return self.decode(row[0]), row[1]
+
+    def _disk_put(self, key: str, value: Any, now: float) -> None:
+        if self._conn is None:
+            return
+        encoded = self.encode(value)
+        with self._db_lock:
+            cursor = self._conn.execute(
+                f"INSERT OR IGNORE INTO {self.table} (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, encoded, now, now),
+            )
+            if cursor.rowcount:
+                self._disk_count += 1
+            else:
+                self._conn.execute(
+                    f"UPDATE {self.table} SET value = ?, created_at = ?, last_access = ? WHERE key = ?",
+                    (encoded, now, now, key),
+                )
+            self._pending_access.pop(key, None)
+            self._flush_access()
+            if self.ttl_seconds is not None and now - self._last_sweep >= self.sweep_seconds:
+                self._last_sweep = now
+                cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._disk_count -= cursor.rowcount
+            if self._disk_count > self.max_disk_entries + self.evict_batch:
+                # Other processes may share the file, so recount before evicting
+                self._disk_count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+                excess = self._disk_count - self.max_disk_entries
+                if excess > 0:
+                    cursor = self._conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY last_access LIMIT ?)",
+                        (excess,),
+                    )
+                    self._disk_count -= cursor.rowcount
+            self._conn.commit()
+
+    def _flush_access(self) -> None:
+        # Called with _db_lock held; the caller commits
+        if self._pending_access:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_access.items()],
+            )
+            self._pending_access.clear()
@@ -0,0 +1,292 @@
+# src/metrics.py
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from src.configs.config import METRICS_EXPORTERS, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PORT
+from src.token_counting import count_tokens
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Per-node metrics. create_workflow wraps every node with instrument_node, which
+# collects one NodeMetrics record per node execution and hands it to the
+# configured exporters.
+
+@dataclass
+class NodeMetrics:
+    node: str
+    query_id: Optional[str] = None
+    wall_time: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retrievals: int = 0
+    retrieval_time: float = 0.0
+    retries: int = 0
+    hedges: int = 0
+    timestamp: float = field(default_factory=time.time)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **increments) -> None:
+        # LLM callbacks and retrievals may report from worker threads
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        record = asdict(self)
+        record.pop("_lock")
+        return record
+
+_current_node_metrics = contextvars.ContextVar("current_node_metrics", default=None)
+
+def _message_text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    # Counts LLM calls and tokens into the NodeMetrics of the running node
+
+    def __init__(self, record: NodeMetrics):
+        self.record = record
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        prompt_tokens = sum(count_tokens(_message_text(message)) for prompt in messages for message in prompt)
+        self.record.add(llm_calls=len(messages), prompt_tokens=prompt_tokens)
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self.record.add(llm_calls=len(prompts), prompt_tokens=sum(count_tokens(prompt) for prompt in prompts))
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        completion_tokens = sum(count_tokens(generation.text) for generations in response.generations for generation in generations)
+        self.record.add(completion_tokens=completion_tokens)
+
+# LangChain adds the handler held in this context variable to every callback
+# manager configured while it is set, so any model called inside a node is
+# counted without passing callbacks around
+_metrics_handler_var = contextvars.ContextVar("metrics_callback_handler", default=None)
+register_configure_hook(_metrics_handler_var, inheritable=True)
+
+def record_retrieval(count: int, seconds: float) -> None:
+    record = _current_node_metrics.get()
+    if record is not None:
+        record.add(retrievals=count, retrieval_time=seconds)
+
+def record_resilience(retries: int = 0, hedges: int = 0) -> None:
+    # Retries and hedged duplicates sent by src/resilience.py on behalf of the running node
+    record = _current_node_metrics.get()
+    if record is not None:
+        record.add(retries=retries, hedges=hedges)
+
+# Exporters
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    # Cumulative bucket counts for Prometheus plus a sliding window of recent
+    # samples for percentiles
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = 1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        return float(np.percentile(np.fromiter(self.samples, dtype=np.float64), p))
+
+class HistogramExporter:
+    # Aggregates records in process: wall-time histograms and totals per node
+
+    def __init__(self):
+        self.durations = defaultdict(Histogram)
+        self.totals = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def export(self, record: NodeMetrics) -> None:
+        with self._lock:
+            self.durations[record.node].observe(record.wall_time)
+            totals = self.totals[record.node]
+            totals["calls"] += 1
+            totals["llm_calls"] += record.llm_calls
+            totals["prompt_tokens"] += record.prompt_tokens
+            totals["completion_tokens"] += record.completion_tokens
+            totals["retrievals"] += record.retrievals
+            totals["retrieval_time"] += record.retrieval_time
+            totals["retries"] += record.retries
+            totals["hedges"] += record.hedges
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                node: {
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99),
+                    **self.totals[node],
+                }
+                for node, histogram in self.durations.items()
+            }
+
+class PrometheusExporter(HistogramExporter):
+    # Renders the aggregated metrics in the Prometheus text exposition format.
+    # Only the node is used as a label; per-query records go to JsonLinesExporter.
+
+    COUNTERS = {
+        "llm_calls": "rag_node_llm_calls_total",
+        "prompt_tokens": "rag_node_prompt_tokens_total",
+        "completion_tokens": "rag_node_completion_tokens_total",
+        "retrievals": "rag_node_retrievals_total",
+        "retrieval_time": "rag_node_retrieval_seconds_total",
+        "retries": "rag_node_retries_total",
+        "hedges": "rag_node_hedges_total",
+    }
+
+    def render(self) -> str:
+        lines = ["# TYPE rag_node_duration_seconds histogram"]
+        with self._lock:
+            for node, histogram in sorted(self.durations.items()):
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'rag_node_duration_seconds_bucket{{node="{node}",le="{bound}"}} {count}')
+                lines.append(f'rag_node_duration_seconds_bucket{{node="{node}",le="+Inf"}} {histogram.count}')
+                lines.append(f'rag_node_duration_seconds_sum{{node="{node}"}} {histogram.sum}')
+                lines.append(f'rag_node_duration_seconds_count{{node="{node}"}} {histogram.count}')
+            for key, name in self.COUNTERS.items():
+                lines.append(f"# TYPE {name} counter")
+                for node, totals in sorted(self.totals.items()):
+                    lines.append(f'{name}{{node="{node}"}} {totals[key]}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on port {port}")
+        return server
+
+class JsonLinesExporter:
+    # Appends every record, query id included, to a JSON lines file
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record: NodeMetrics) -> None:
+        line = json.dumps(record.to_dict())
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+class MetricsRegistry:
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters or [])
+
+    def add_exporter(self, exporter) -> None:
+        self.exporters.append(exporter)
+
+    def get_exporter(self, exporter_class):
+        return next((exporter for exporter in self.exporters if isinstance(exporter, exporter_class)), None)
+
+    def export(self, record: NodeMetrics) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logger.error(f"Error exporting metrics with {type(exporter).__name__}: {str(e)}")
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def _create_metrics() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    for name in [name.strip() for name in METRICS_EXPORTERS.split(",") if name.strip()]:
+        if name == "histogram":
+            registry.add_exporter(HistogramExporter())
+        elif name == "prometheus":
+            exporter = PrometheusExporter()
+            if METRICS_PROMETHEUS_PORT:
+                exporter.serve(METRICS_PROMETHEUS_PORT)
+            registry.add_exporter(exporter)
+        elif name == "jsonl":
+            registry.add_exporter(JsonLinesExporter(METRICS_JSONL_PATH))
+        else:
+            logger.warning(f"Unknown metrics exporter: {name}")
+    return registry
+
+def get_metrics() -> MetricsRegistry:
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = _create_metrics()
+    return _metrics
+
+def _start_node(name: str, state):
+    record = NodeMetrics(node=name, query_id=state.get("query_id"))
+    tokens = (_current_node_metrics.set(record), _metrics_handler_var.set(MetricsCallbackHandler(record)))
+    return record, tokens, time.perf_counter()
+
+def _finish_node(record: NodeMetrics, tokens, start: float) -> None:
+    record.wall_time = time.perf_counter() - start
+    _metrics_handler_var.reset(tokens[1])
+    _current_node_metrics.reset(tokens[0])
+    get_metrics().export(record)
+
+def instrument_node(name: str, func):
+    # Works for both sync and async nodes; an async node's context variables
+    # are inherited by the tasks it starts, so their retrievals are counted too
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def instrumented_async_node(state):
+            record, tokens, start = _start_node(name, state)
+            try:
+                return await func(state)
+            finally:
+                _finish_node(record, tokens, start)
+        return instrumented_async_node
+
+    @functools.wraps(func)
+    def instrumented_node(state):
+        record, tokens, start = _start_node(name, state)
+        try:
+            return func(state)
+        finally:
+            _finish_node(record, tokens, start)
+    return instrumented_node
@@ -0,0 +1,114 @@
+# src/node_memo.py
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from src.providers import MODEL_NAME, get_node_cache
+from src.query_transformations import query_rewrite_template, step_back_template, subquery_decomposition_template, query_transformation_cache_template
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Memoizes node outputs keyed on the state fields each node actually reads, so
+# resubmitting a request with one changed field replays the unaffected stages
+# and re-executes only the nodes downstream of the change. Only the query
+# transformation nodes are memoized: their output depends on nothing but the
+# query, the model and the prompt, which are all part of the key. Retrieval and
+# the nodes after it also depend on the index contents and retrieval settings,
+# so they always run.
+
+NODE_INPUT_FIELDS = {
+    "query_rewriting": ("initial_query",),
+    "step_back_prompting": ("rewritten_query",),
+    "sub_query_decomposition": ("rewritten_query",),
+    "query_transformation": ("initial_query",),
+}
+
+# The prompt template behind each memoized node; a prompt edit or a model change
+# gives the node new keys, so stored outputs are not replayed after either
+NODE_TEMPLATES = {
+    "query_rewriting": query_rewrite_template,
+    "step_back_prompting": step_back_template,
+    "sub_query_decomposition": subquery_decomposition_template,
+    "query_transformation": query_transformation_cache_template,
+}
+
+def node_fingerprint(name: str) -> str:
+    return hashlib.sha256(f"{MODEL_NAME}\x00{NODE_TEMPLATES.get(name, '')}".encode("utf-8")).hexdigest()
+
+def memo_key(name: str, state: dict, fields) -> str:
+    inputs = {field: state.get(field) for field in fields}
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{name}\x00{node_fingerprint(name)}\x00{payload}".encode("utf-8")).hexdigest()
+
+def _dump(update: dict) -> dict:
+    # Messages are stored in LangChain's dict form so the entry is plain JSON
+    return {
+        key: {"__messages__": messages_to_dict(value)} if key == "messages" else value
+        for key, value in update.items()
+    }
+
+def _load(value: dict) -> dict:
+    return {
+        key: messages_from_dict(item["__messages__"]) if isinstance(item, dict) and "__messages__" in item else item
+        for key, item in value.items()
+    }
+
+def _memoizable(update) -> bool:
+    # Nodes return {} when they could not run; keep those out of the cache so
+    # the next submission retries them
+    if not isinstance(update, dict) or not update:
+        return False
+    messages = update.get("messages", [])
+    return all(isinstance(message, BaseMessage) for message in messages)
+
+def _lookup(name: str, state: dict, fields):
+    # Requests without initial_query predate new_request; their inputs are not
+    # fully described by the state fields, so they bypass the cache
+    if not state.get("initial_query"):
+        return None, None, None
+    cache = get_node_cache()
+    if cache is None:
+        return None, None, None
+    key = memo_key(name, state, fields)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.error(f"Error reading the node cache for {name}: {str(e)}")
+        return cache, key, None
+    return cache, key, cached
+
+def _store(name: str, cache, key, update) -> None:
+    if cache is None or not _memoizable(update):
+        return
+    try:
+        cache.put(key, _dump(update))
+    except Exception as e:
+        logger.error(f"Error writing the node cache for {name}: {str(e)}")
+
+def memoize_node(name: str, func, fields):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def memoized_async_node(state):
+            cache, key, cached = await asyncio.to_thread(_lookup, name, state, fields)
+            if cached is not None:
+                logger.info(f"Replaying memoized output of {name}")
+                return _load(cached)
+            update = await func(state)
+            await asyncio.to_thread(_store, name, cache, key, update)
+            return update
+        return memoized_async_node
+
+    @functools.wraps(func)
+    def memoized_node(state):
+        cache, key, cached = _lookup(name, state, fields)
+        if cached is not None:
+            logger.info(f"Replaying memoized output of {name}")
+            return _load(cached)
+        update = func(state)
+        _store(name, cache, key, update)
+        return update
+    return memoized_node
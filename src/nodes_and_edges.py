@@ -1,145 +1,321 @@
 # src/nodes_and_edges
 
+import asyncio
 import logging
+from functools import cache
 from langchain_core.messages import HumanMessage
-from src.query_transformations import rewrite_query, generate_step_back_query, decompose_query
-from src.configs.pinecone_config import vector_store
+from src.query_transformations import rewrite_query, generate_step_back_query, decompose_query, transform_query
+from src.query_transformations import arewrite_query, agenerate_step_back_query, adecompose_query, atransform_query
+from src.providers import MODEL_NAME, get_chat_model, get_embeddings, get_vector_store
+from src.retrieval import retrieve_sub_queries, aretrieve_sub_queries, adaptive_cutoff, build_search_kwargs, fetch_k
+from src.tools_condition import classify_query, extract_query
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from src.agent_state import AgentState
+from src.configs.config import SUMMARIZATION_MIN_TOKENS, SUMMARIZATION_MAX_CONCURRENCY
+from src.configs.config import CONTEXT_TOKEN_BUDGET, CONTEXT_USE_MMR, CONTEXT_MMR_LAMBDA, RETRIEVAL_MODE
+from src.context_packing import pack_context
+from src.resilience import with_resilience
+from src.token_counting import count_tokens
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-MODEL_NAME = "gpt-4o-mini"
-
-def query_rewriting_node(state: AgentState) -> AgentState:
+# Nodes return only the state keys they change, so parallel branches never
+# write the same key in the same step. State changes are logged by the
+# trace_node wrapper in src/state_tracing.py. Every node has an async twin
+# (prefixed with "a") so the compiled graph also runs under ainvoke/abatch.
+
+def _original_query(state: AgentState) -> str:
+    # new_request sets initial_query; callers that only pass messages still work
+    # as long as the thread has no earlier requests
+    return state.get("initial_query") or state["messages"][0].content
+
+def _filter_sub_queries(sub_queries: list[str]) -> list[str]:
+    return [query.strip() for query in sub_queries if query.strip() and not query.startswith("Sub-queries for the original query:")]
+
+def query_routing_node(state: AgentState) -> dict:
+    logger.info("Starting Query Routing Node.")
+    original_query = _original_query(state)
+    query = extract_query(original_query)
+
+    route = classify_query(query, get_embeddings())
+    return _query_routing_update(original_query, query, route)
+
+async def aquery_routing_node(state: AgentState) -> dict:
+    logger.info("Starting Query Routing Node.")
+    original_query = _original_query(state)
+    query = extract_query(original_query)
+
+    # Classification may embed the query, so keep it off the event loop
+    route = await asyncio.to_thread(classify_query, query, get_embeddings())
+    return _query_routing_update(original_query, query, route)
+
+def _query_routing_update(original_query: str, query: str, route: str) -> dict:
+    if route != "simple":
+        return {"route": route}
+
+    # Simple queries are retrieved as they are, as the only sub-query
+    return {
+        "route": route,
+        "initial_query": original_query,
+        "rewritten_query": query,
+        "sub_queries": [query],
+    }
+
+def query_rewriting_node(state: AgentState) -> dict:
     logger.info("Starting Query Rewriting Node.")
-    original_query = state["messages"][0].content
+    original_query = _original_query(state)
 
     # Query Rewriting
-    state["initial_query"] = original_query
     rewritten_query = rewrite_query(original_query)
-    logger.info(f"Rewritten Query: {rewritten_query}")
-    state["messages"].append(HumanMessage(content=rewritten_query))
-    state["rewritten_query"] = HumanMessage(content=rewritten_query)
+    return _query_rewriting_update(original_query, rewritten_query)
+
+async def aquery_rewriting_node(state: AgentState) -> dict:
+    logger.info("Starting Query Rewriting Node.")
+    original_query = _original_query(state)
 
-    logger.info(f"State after query rewriting: {state}")
-    return state
+    # Query Rewriting
+    rewritten_query = await arewrite_query(original_query)
+    return _query_rewriting_update(original_query, rewritten_query)
+
+def _query_rewriting_update(original_query: str, rewritten_query: str) -> dict:
+    logger.info(f"Rewritten Query: {rewritten_query}")
+    return {
+        "initial_query": original_query,
+        "rewritten_query": rewritten_query,
+        "messages": [HumanMessage(content=rewritten_query)],
+    }
 
-def step_back_prompting_node(state: AgentState) -> AgentState:
+def step_back_prompting_node(state: AgentState) -> dict:
     logger.info("Starting Step-back Prompting Node.")
-    rewritten_query = state["messages"][-1].content
+    rewritten_query = state["rewritten_query"]
 
     # Step-back Prompting
     step_back_query = generate_step_back_query(rewritten_query)
+    return _step_back_update(step_back_query)
+
+async def astep_back_prompting_node(state: AgentState) -> dict:
+    logger.info("Starting Step-back Prompting Node.")
+    rewritten_query = state["rewritten_query"]
+
+    # Step-back Prompting
+    step_back_query = await agenerate_step_back_query(rewritten_query)
+    return _step_back_update(step_back_query)
+
+def _step_back_update(step_back_query: str) -> dict:
     logger.info(f"Step-back Query: {step_back_query}")
-    state["messages"].append(HumanMessage(content=step_back_query))
+    return {
+        "step_back_query": step_back_query,
+        "messages": [HumanMessage(content=step_back_query)],
+    }
+
+def sub_query_decomposition_node(state: AgentState) -> dict:
+    logger.info("Starting Sub-query Decomposition Node.")
+    rewritten_query = state["rewritten_query"]
+
+    # Sub-query Decomposition
+    sub_queries = _filter_sub_queries(decompose_query(rewritten_query))
+    logger.info(f"Filtered Sub-queries: {sub_queries}")
 
-    logger.info(f"State after step-back prompting: {state}")
-    return state
+    return {"sub_queries": sub_queries}
 
-def sub_query_decomposition_node(state: AgentState) -> AgentState:
+async def asub_query_decomposition_node(state: AgentState) -> dict:
     logger.info("Starting Sub-query Decomposition Node.")
-    rewritten_query = state["messages"][-2].content
+    rewritten_query = state["rewritten_query"]
 
     # Sub-query Decomposition
-    sub_queries = decompose_query(rewritten_query)
-    sub_queries = [query.strip() for query in sub_queries if query.strip() and not query.startswith("Sub-queries for the original query:")]
+    sub_queries = _filter_sub_queries(await adecompose_query(rewritten_query))
     logger.info(f"Filtered Sub-queries: {sub_queries}")
 
-    # Save sub-queries in the state
-    state["sub_queries"] = sub_queries
+    return {"sub_queries": sub_queries}
+
+def query_transformation_node(state: AgentState) -> dict:
+    logger.info("Starting Query Transformation Node.")
+    original_query = _original_query(state)
+
+    # Rewrite, step-back and decomposition from a single structured LLM call
+    transformed = transform_query(original_query)
+    return _query_transformation_update(original_query, transformed)
+
+async def aquery_transformation_node(state: AgentState) -> dict:
+    logger.info("Starting Query Transformation Node.")
+    original_query = _original_query(state)
 
-    logger.info(f"State after sub-query decomposition: {state}")
-    return state
+    # Rewrite, step-back and decomposition from a single structured LLM call
+    transformed = await atransform_query(original_query)
+    return _query_transformation_update(original_query, transformed)
 
-def retrieval_node(state: AgentState) -> AgentState:
+def _query_transformation_update(original_query: str, transformed: dict) -> dict:
+    sub_queries = _filter_sub_queries(transformed["sub_queries"])
+    logger.info(f"Rewritten Query: {transformed['rewritten_query']}")
+    logger.info(f"Step-back Query: {transformed['step_back_query']}")
+    logger.info(f"Filtered Sub-queries: {sub_queries}")
+
+    return {
+        "initial_query": original_query,
+        "rewritten_query": transformed["rewritten_query"],
+        "step_back_query": transformed["step_back_query"],
+        "sub_queries": sub_queries,
+        "messages": [
+            HumanMessage(content=transformed["rewritten_query"]),
+            HumanMessage(content=transformed["step_back_query"]),
+        ],
+    }
+
+def retrieval_node(state: AgentState) -> dict:
     logger.info("Starting Retrieval Node.")
     
-    sub_queries = state.get("sub_queries", [])
+    sub_queries = state.get("sub_queries") or []
     if not sub_queries:
         logger.error("Sub-queries are missing or empty, cannot proceed with retrieval.")
-        return state
+        return {}
     
-    summarized_content = []
-    for sub_query in sub_queries:
-        logger.info(f"Retrieving documents for sub-query: {sub_query}")
-        search_results = vector_store.similarity_search(query=sub_query, k=2)
+    # Sub-queries are searched concurrently; results come back in sub-query order.
+    # The request's content type and keywords narrow the search in the vector store
+    all_search_results = retrieve_sub_queries(
+        get_vector_store(), get_embeddings(), sub_queries, k=fetch_k(),
+        search_kwargs=build_search_kwargs(state.get("metadata"))
+    )
+    return _retrieval_update(sub_queries, all_search_results)
+
+async def aretrieval_node(state: AgentState) -> dict:
+    logger.info("Starting Retrieval Node.")
+
+    sub_queries = state.get("sub_queries") or []
+    if not sub_queries:
+        logger.error("Sub-queries are missing or empty, cannot proceed with retrieval.")
+        return {}
 
+    all_search_results = await aretrieve_sub_queries(
+        get_vector_store(), get_embeddings(), sub_queries, k=fetch_k(),
+        search_kwargs=build_search_kwargs(state.get("metadata"))
+    )
+    return _retrieval_update(sub_queries, all_search_results)
+
+def _retrieval_update(sub_queries: list[str], all_search_results: list[list]) -> dict:
+    # Keep one entry per sub-query, with scores for context assembly
+    retrieved_documents = []
+    for sub_query, search_results in zip(sub_queries, all_search_results):
+        if RETRIEVAL_MODE == "adaptive":
+            fetched = len(search_results)
+            search_results = adaptive_cutoff(search_results)
+            logger.info("Kept %d of %d candidates for sub-query: %s", len(search_results), fetched, sub_query)
         if not search_results:
             logger.warning(f"No documents retrieved for sub-query: {sub_query}")
-            continue
+        else:
+            logger.info("Retrieved %d documents for sub-query: %s", len(search_results), sub_query)
+
+        retrieved_documents.append([
+            {"id": doc.id, "content": doc.page_content, "metadata": doc.metadata, "score": float(score)}
+            for doc, score in search_results
+        ])
+
+    return {"retrieved_documents": retrieved_documents}
+
+def context_assembly_node(state: AgentState) -> dict:
+    logger.info("Starting Context Assembly Node.")
+
+    retrieved_documents = state.get("retrieved_documents") or []
+    if not retrieved_documents:
+        logger.error("No retrieved documents to assemble.")
+        return {}
+
+    # Deduplicate across sub-queries and pack the best chunks into the token budget
+    packed = pack_context(
+        retrieved_documents,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        use_mmr=CONTEXT_USE_MMR,
+        mmr_lambda=CONTEXT_MMR_LAMBDA,
+        embeddings=get_embeddings() if CONTEXT_USE_MMR else None
+    )
 
-        docs = "\n\n".join([doc.page_content for doc in search_results])
-        logger.info(f"Documents retrieved for sub-query '{sub_query}': {docs}")
+    # Keep one entry per sub-query so summarization can zip them back together
+    summarized_content = ["\n\n".join(document["content"] for document in documents) for documents in packed]
+    return {"summarized_content": summarized_content}
 
-        summarized_content.append(docs)
+async def acontext_assembly_node(state: AgentState) -> dict:
+    # Packing is CPU-bound (and embeds chunks when MMR is on), so keep it off the event loop
+    return await asyncio.to_thread(context_assembly_node, state)
 
-    state["summarized_content"] = summarized_content
+summarization_prompt = PromptTemplate(
+    template="""You are an AI assistant tasked with summarizing the content retrieved for each sub-query. 
+    Given the retrieved documents, provide a concise summary that captures the essential information.
 
-    logger.info(f"State after retrieval: {state}")
-    return state
+    Sub-query: {sub_query}
+    Retrieved Documents: {documents}
 
-def summarization_node(state: AgentState) -> AgentState:
-    logger.info("Starting Summarization Node.")
-    
-    summarized_content = state.get("summarized_content", [])
-    if not summarized_content:
-        logger.error("No documents to summarize.")
-        return state
+    Summary:""",
+    input_variables=["sub_query", "documents"],
+)
 
-    summarized_context = "\n\n".join(summarized_content)
-    logger.info(f"Summarized context: {summarized_context}")
+@cache
+def get_summarization_chain():
+    # Built once and shared by every request; batch() applies the resilience
+    # policy to each summary separately
+    return with_resilience(summarization_prompt | get_chat_model(MODEL_NAME, temperature=0) | StrOutputParser(), "summarization")
 
-    summarized_output = []
-    for sub_query, docs in zip(state["sub_queries"], summarized_content):
-        summarization_prompt = PromptTemplate(
-            template="""You are an AI assistant tasked with summarizing the content retrieved for each sub-query. 
-            Given the retrieved documents, provide a concise summary that captures the essential information.
+def _pending_summaries(state: AgentState) -> list[tuple]:
+    summarized_content = state.get("summarized_content") or []
+    if not summarized_content:
+        logger.error("No documents to summarize.")
+        return []
+
+    # Documents already under the token threshold are passed through unchanged
+    pending = [
+        (i, sub_query, docs)
+        for i, (sub_query, docs) in enumerate(zip(state["sub_queries"], summarized_content))
+        if docs and count_tokens(docs) >= SUMMARIZATION_MIN_TOKENS
+    ]
+    logger.info("Summarizing documents for %d of %d sub-queries.", len(pending), len(summarized_content))
+    return pending
+
+def summarization_node(state: AgentState) -> dict:
+    logger.info("Starting Summarization Node.")
 
-            Sub-query: {sub_query}
-            Retrieved Documents: {documents}
+    pending = _pending_summaries(state)
+    if not pending:
+        return {}
 
-            Summary:""",
-            input_variables=["sub_query", "documents"],
-        )
+    # Summaries run concurrently; a failed one keeps the retrieved documents
+    responses = get_summarization_chain().batch(
+        [{"sub_query": sub_query, "documents": docs} for _, sub_query, docs in pending],
+        config={"max_concurrency": SUMMARIZATION_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
+    return _summarization_update(state, pending, responses)
 
-        summary_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0, streaming=True)
-        summary_chain = summarization_prompt | summary_llm | StrOutputParser()
+async def asummarization_node(state: AgentState) -> dict:
+    logger.info("Starting Summarization Node.")
 
-        try:
-            summary_response = summary_chain.invoke({"sub_query": sub_query, "documents": docs})
-            summary_text = summary_response.content if hasattr(summary_response, 'content') else str(summary_response)
+    pending = _pending_summaries(state)
+    if not pending:
+        return {}
 
-            if not summary_text.strip():
-                logger.warning(f"Summarization failed for sub-query: {sub_query}")
-                continue
+    responses = await get_summarization_chain().abatch(
+        [{"sub_query": sub_query, "documents": docs} for _, sub_query, docs in pending],
+        config={"max_concurrency": SUMMARIZATION_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
+    return _summarization_update(state, pending, responses)
 
-            summarized_output.append(summary_text)
-            logger.info(f"Summary for sub-query '{sub_query}': {summary_text}")
-        except Exception as e:
-            logger.error(f"Error during summarization for sub-query '{sub_query}': {str(e)}")
+def _summarization_update(state: AgentState, pending: list[tuple], responses: list) -> dict:
+    summarized_output = list(state["summarized_content"])
+    for (i, sub_query, _), response in zip(pending, responses):
+        if isinstance(response, Exception):
+            logger.error(f"Error during summarization for sub-query '{sub_query}': {str(response)}")
+            continue
+        if not response.strip():
+            logger.warning(f"Summarization failed for sub-query: {sub_query}")
+            continue
 
-    state["summarized_content"] = summarized_output
+        summarized_output[i] = response
+        logger.info("Summary for sub-query (%d chars): %s", len(response), sub_query)
 
-    logger.info(f"State after summarization: {state}")
-    return state
+    return {"summarized_content": summarized_output}
 
-def final_generation_node(state: AgentState) -> AgentState:
-    logger.info("Generating the final answer based on summarized content.")
-    
-    summarized_content = state.get("summarized_content", [])
-    
-    if not summarized_content or len(summarized_content) == 0:
-        logger.error("No summarized content available. Exiting.")
-        return state
-    
-    summarized_context = "\n\n".join(summarized_content)
-
-    prompt = PromptTemplate(
+final_generation_prompt = PromptTemplate(
     template="""You are an expert AI assistant specializing in generating accurate, functional code and creating file structures based on user specifications. Your task is to produce code snippets, file templates, or complete file structures that align precisely with the user's requirements. Follow these guidelines:
 
     1. **Technical Accuracy**: Ensure that the code you generate is syntactically correct, follows best practices, and is ready for execution or integration.
@@ -155,23 +331,56 @@ def final_generation_node(state: AgentState) -> AgentState:
     Summarized Context: {context}
     Output:""",
     input_variables=["question", "context"],
-    )
+)
+
+@cache
+def get_final_generation_chain():
+    # Built once and shared by every request; the streaming client lets
+    # graph.stream(stream_mode="messages") forward tokens as they arrive, so
+    # only a failure before the first token is retried
+    return with_resilience(final_generation_prompt | get_chat_model(MODEL_NAME, temperature=0, streaming=True) | StrOutputParser(), "generation", streaming=True)
+
+def _final_generation_inputs(state: AgentState) -> dict:
+    summarized_content = [content for content in state.get("summarized_content") or [] if content]
+    if not summarized_content:
+        logger.error("No summarized content available. Exiting.")
+        return {}
+    return {"context": "\n\n".join(summarized_content), "question": state["initial_query"]}
 
-    llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0, streaming=True)
-    rag_chain = prompt | llm | StrOutputParser()
+def _final_generation_update(final_response: str) -> dict:
+    logger.info("Final response generated.")
+    return {
+        "final_response": final_response,
+        "messages": [HumanMessage(content=final_response)],
+    }
+
+def final_generation_node(state: AgentState) -> dict:
+    logger.info("Generating the final answer based on summarized content.")
 
-    question = state["initial_query"]
+    inputs = _final_generation_inputs(state)
+    if not inputs:
+        return {}
 
     logger.info("Invoking the RAG chain.")
     try:
-        response = rag_chain.invoke({"context": summarized_context, "question": question})
-        
-        logger.info("Final response generated.")
-        state["final_response"] = response.content if hasattr(response, 'content') else str(response)
-        
-        state["messages"].append(HumanMessage(content=state["final_response"]))
+        # Stream the answer so graph.stream(stream_mode="messages") can forward
+        # each token to the UI as it arrives
+        return _final_generation_update("".join(get_final_generation_chain().stream(inputs)))
     except Exception as e:
         logger.error(f"Error during final response generation: {str(e)}")
+        return {}
 
-    logger.info(f"Final state after generation: {state}")
-    return state
+async def afinal_generation_node(state: AgentState) -> dict:
+    logger.info("Generating the final answer based on summarized content.")
+
+    inputs = _final_generation_inputs(state)
+    if not inputs:
+        return {}
+
+    logger.info("Invoking the RAG chain.")
+    try:
+        chunks = [chunk async for chunk in get_final_generation_chain().astream(inputs)]
+        return _final_generation_update("".join(chunks))
+    except Exception as e:
+        logger.error(f"Error during final response generation: {str(e)}")
+        return {}
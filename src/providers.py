@@ -0,0 +1,164 @@
+# src/providers.py
+import logging
+import threading
+import time
+import httpx
+from src.configs.config import OPENAI_API_KEY, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, require_openai_api_key
+from src.configs.config import VECTOR_STORE_BACKEND, LOCAL_VECTOR_STORE_PATH, LOCAL_VECTOR_STORE_DTYPE, RESILIENCE_ENABLED
+from src.configs.config import LLM_CACHE_PATH, LLM_CACHE_SIZE, LLM_CACHE_DISK_SIZE, LLM_CACHE_TTL_SECONDS
+from src.configs.config import NODE_CACHE_PATH, NODE_CACHE_SIZE, NODE_CACHE_DISK_SIZE, NODE_CACHE_TTL_SECONDS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "gpt-4o-mini"
+
+# Registry of lazily created, process-wide clients. Each provider is a factory
+# that is called at most once per distinct set of arguments; the instance is
+# then shared by every node and session in the process.
+_factories = {}
+_instances = {}
+_lock = threading.RLock()
+
+def register_provider(name: str, factory) -> None:
+    # Registering replaces the factory and drops instances it already built,
+    # which is how benchmarks swap in fake models and stores
+    with _lock:
+        _factories[name] = factory
+        for key in [key for key in _instances if key[0] == name]:
+            del _instances[key]
+
+def get_provider(name: str, **kwargs):
+    key = (name, tuple(sorted(kwargs.items())))
+    instance = _instances.get(key)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                start = time.perf_counter()
+                instance = _factories[name](**kwargs)
+                _instances[key] = instance
+                logger.info(f"Initialized provider '{name}' in {time.perf_counter() - start:.3f}s")
+    return instance
+
+def reset_providers() -> None:
+    with _lock:
+        _instances.clear()
+
+def get_chat_model(model_name: str = MODEL_NAME, temperature: float = 0, streaming: bool = False):
+    return get_provider("chat_model", model_name=model_name, temperature=temperature, streaming=streaming)
+
+def get_embeddings():
+    return get_provider("embeddings")
+
+def get_pinecone_index():
+    return get_provider("pinecone_index")
+
+def get_vector_store():
+    return get_provider("vector_store")
+
+def get_llm_cache():
+    return get_provider("llm_cache")
+
+def get_node_cache():
+    return get_provider("node_cache")
+
+# Default factories
+
+def _create_http_client():
+    return httpx.Client(limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS))
+
+def _create_async_http_client():
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS))
+
+def _create_chat_model(model_name: str, temperature: float, streaming: bool):
+    from langchain_openai import ChatOpenAI
+
+    require_openai_api_key()
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        streaming=streaming,
+        openai_api_key=OPENAI_API_KEY,
+        # src/resilience.py retries the chains built on this model
+        max_retries=0 if RESILIENCE_ENABLED else 2,
+        http_client=get_provider("http_client"),
+        http_async_client=get_provider("async_http_client")
+    )
+
+def _create_embeddings():
+    from src.configs.pinecone_config import create_embeddings
+    return create_embeddings(http_client=get_provider("http_client"), http_async_client=get_provider("async_http_client"))
+
+def _create_pinecone_client():
+    from src.configs.pinecone_config import create_pinecone_client
+    return create_pinecone_client()
+
+def _create_pinecone_index():
+    # The index existence check runs here, once per process
+    from src.configs.pinecone_config import create_pinecone_index
+    return create_pinecone_index(get_provider("pinecone_client"))
+
+def _create_vector_store():
+    if VECTOR_STORE_BACKEND == "local":
+        from src.local_vector_store import LocalVectorStore
+        return LocalVectorStore(LOCAL_VECTOR_STORE_PATH, get_embeddings(), dtype=LOCAL_VECTOR_STORE_DTYPE)
+    if VECTOR_STORE_BACKEND != "pinecone":
+        raise ValueError(f"Unknown vector store backend: {VECTOR_STORE_BACKEND}")
+
+    from src.configs.pinecone_config import create_vector_store
+    return create_vector_store(get_pinecone_index(), get_embeddings())
+
+def _create_llm_cache():
+    from src.llm_cache import LLMCache
+    return LLMCache(
+        max_entries=LLM_CACHE_SIZE,
+        db_path=LLM_CACHE_PATH or None,
+        max_disk_entries=LLM_CACHE_DISK_SIZE,
+        ttl_seconds=LLM_CACHE_TTL_SECONDS
+    )
+
+def _create_node_cache():
+    # Same LRU/TTL SQLite store as the LLM cache, in its own file
+    from src.llm_cache import LLMCache
+    return LLMCache(
+        max_entries=NODE_CACHE_SIZE,
+        db_path=NODE_CACHE_PATH or None,
+        max_disk_entries=NODE_CACHE_DISK_SIZE,
+        ttl_seconds=NODE_CACHE_TTL_SECONDS
+    )
+
+register_provider("http_client", _create_http_client)
+register_provider("async_http_client", _create_async_http_client)
+register_provider("chat_model", _create_chat_model)
+register_provider("embeddings", _create_embeddings)
+register_provider("pinecone_client", _create_pinecone_client)
+register_provider("pinecone_index", _create_pinecone_index)
+register_provider("vector_store", _create_vector_store)
+register_provider("llm_cache", _create_llm_cache)
+register_provider("node_cache", _create_node_cache)
+
+def warm_up() -> dict:
+    # Create the clients the graph needs ahead of the first request and return
+    # how long each one took, in seconds
+    timings = {}
+    for name, create in [
+        ("chat_model", get_chat_model),
+        ("streaming_chat_model", lambda: get_chat_model(streaming=True)),
+        ("embeddings", get_embeddings),
+        ("vector_store", get_vector_store),
+    ]:
+        start = time.perf_counter()
+        create()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+if __name__ == "__main__":
+    # Measure cold start: importing the graph should cost about as much as
+    # importing its dependencies, with client creation deferred to warm_up()
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    import src.workflow  # noqa: F401
+    print(f"import src.workflow: {time.perf_counter() - start:.3f}s")
+    for name, seconds in warm_up().items():
+        print(f"warm up {name}: {seconds:.3f}s")
@@ -1,16 +1,29 @@
 #src/query_transformations.py
+import json
 import logging
-from langchain_openai import ChatOpenAI
+from functools import cache
 from langchain.prompts import PromptTemplate
-from src.configs.config import OPENAI_API_KEY
-
-MODEL_NAME = "gpt-4o-mini"
+from pydantic import BaseModel, Field
+from src.providers import MODEL_NAME, get_chat_model
+from src.llm_cache import cached_llm_call, acached_llm_call
+from src.resilience import with_resilience
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Chains are built on first use from the shared chat model, so importing this
+# module creates no clients. All of them run at temperature 0, so their parsed
+# results go through the exact-match LLM cache in src/llm_cache.py under the
+# chain names "rewrite", "step_back", "decompose" and "transform", and call
+# the model under the "transformation" resilience policy.
+
+async def _content(response) -> str:
+    return (await response).content
+
+async def _model_dump(response) -> dict:
+    return (await response).model_dump()
+
 # Query Rewriting
-re_write_llm = ChatOpenAI(temperature=0, model_name=MODEL_NAME, openai_api_key=OPENAI_API_KEY)
 query_rewrite_template = """You are an AI assistant tasked with reformulating user queries to improve retrieval in a RAG system. 
 Given the original query, rewrite it to be more specific, detailed, and likely to retrieve relevant information.
 
@@ -18,20 +31,38 @@ Original query: {original_query}
 
 Rewritten query:"""
 query_rewrite_prompt = PromptTemplate(input_variables=["original_query"], template=query_rewrite_template)
-query_rewriter = query_rewrite_prompt | re_write_llm
+
+@cache
+def get_query_rewriter():
+    return with_resilience(query_rewrite_prompt | get_chat_model(MODEL_NAME, temperature=0), "transformation")
 
 def rewrite_query(original_query: str) -> str:
     try:
         logger.info(f"Rewriting query: {original_query}")
-        response = query_rewriter.invoke(original_query)
-        logger.info(f"Rewritten query: {response.content}")
-        return response.content
+        rewritten_query = cached_llm_call(
+            "rewrite", MODEL_NAME, query_rewrite_template, original_query,
+            lambda: get_query_rewriter().invoke(original_query).content
+        )
+        logger.info(f"Rewritten query: {rewritten_query}")
+        return rewritten_query
+    except Exception as e:
+        logger.error(f"Error in query rewriting: {str(e)}")
+        return original_query  # Fallback to the original query if an error occurs
+
+async def arewrite_query(original_query: str) -> str:
+    try:
+        logger.info(f"Rewriting query: {original_query}")
+        rewritten_query = await acached_llm_call(
+            "rewrite", MODEL_NAME, query_rewrite_template, original_query,
+            lambda: _content(get_query_rewriter().ainvoke(original_query))
+        )
+        logger.info(f"Rewritten query: {rewritten_query}")
+        return rewritten_query
     except Exception as e:
         logger.error(f"Error in query rewriting: {str(e)}")
         return original_query  # Fallback to the original query if an error occurs
 
 # Step-back Prompting
-step_back_llm = ChatOpenAI(temperature=0, model_name=MODEL_NAME)
 step_back_template = """You are an AI assistant tasked with generating broader, more general queries to improve context retrieval in a RAG system.
 Given the original query, generate a step-back query that is more general and can help retrieve relevant background information.
 
@@ -39,20 +70,38 @@ Original query: {original_query}
 
 Step-back query:"""
 step_back_prompt = PromptTemplate(input_variables=["original_query"], template=step_back_template)
-step_back_chain = step_back_prompt | step_back_llm
+
+@cache
+def get_step_back_chain():
+    return with_resilience(step_back_prompt | get_chat_model(MODEL_NAME, temperature=0), "transformation")
 
 def generate_step_back_query(original_query: str) -> str:
     try:
         logger.info(f"Generating step-back query for: {original_query}")
-        response = step_back_chain.invoke(original_query)
-        logger.info(f"Step-back query: {response.content}")
-        return response.content
+        step_back_query = cached_llm_call(
+            "step_back", MODEL_NAME, step_back_template, original_query,
+            lambda: get_step_back_chain().invoke(original_query).content
+        )
+        logger.info(f"Step-back query: {step_back_query}")
+        return step_back_query
+    except Exception as e:
+        logger.error(f"Error in step-back query generation: {str(e)}")
+        return original_query  # Fallback to the original query if an error occurs
+
+async def agenerate_step_back_query(original_query: str) -> str:
+    try:
+        logger.info(f"Generating step-back query for: {original_query}")
+        step_back_query = await acached_llm_call(
+            "step_back", MODEL_NAME, step_back_template, original_query,
+            lambda: _content(get_step_back_chain().ainvoke(original_query))
+        )
+        logger.info(f"Step-back query: {step_back_query}")
+        return step_back_query
     except Exception as e:
         logger.error(f"Error in step-back query generation: {str(e)}")
         return original_query  # Fallback to the original query if an error occurs
 
 # Sub-query Decomposition
-sub_query_llm = ChatOpenAI(temperature=0, model_name=MODEL_NAME)
 subquery_decomposition_template = """You are an AI assistant tasked with breaking down complex queries into simpler sub-queries for a RAG system.
 Given the original query, decompose it into 2-4 simpler sub-queries that, when answered together, would provide a comprehensive response to the original query.
 
@@ -66,15 +115,93 @@ Sub-queries:
 3. What are the effects of climate change on agriculture?
 4. What are the impacts of climate change on human health?"""
 subquery_decomposition_prompt = PromptTemplate(input_variables=["original_query"], template=subquery_decomposition_template)
-subquery_decomposer_chain = subquery_decomposition_prompt | sub_query_llm
+
+@cache
+def get_subquery_decomposer_chain():
+    return with_resilience(subquery_decomposition_prompt | get_chat_model(MODEL_NAME, temperature=0), "transformation")
+
+def _parse_sub_queries(content: str) -> list[str]:
+    return [q.strip() for q in content.split('\n') if q.strip() and not q.strip().startswith('Sub-queries:')]
+
+async def _parse_sub_queries_async(response) -> list[str]:
+    return _parse_sub_queries(await _content(response))
 
 def decompose_query(original_query: str) -> list[str]:
     try:
         logger.info(f"Decomposing query: {original_query}")
-        response = subquery_decomposer_chain.invoke(original_query)
-        sub_queries = [q.strip() for q in response.content.split('\n') if q.strip() and not q.strip().startswith('Sub-queries:')]
+        sub_queries = cached_llm_call(
+            "decompose", MODEL_NAME, subquery_decomposition_template, original_query,
+            lambda: _parse_sub_queries(get_subquery_decomposer_chain().invoke(original_query).content)
+        )
+        logger.info(f"Decomposed sub-queries: {sub_queries}")
+        return sub_queries
+    except Exception as e:
+        logger.error(f"Error in query decomposition: {str(e)}")
+        return []  # Return an empty list if an error occurs
+
+async def adecompose_query(original_query: str) -> list[str]:
+    try:
+        logger.info(f"Decomposing query: {original_query}")
+        sub_queries = await acached_llm_call(
+            "decompose", MODEL_NAME, subquery_decomposition_template, original_query,
+            lambda: _parse_sub_queries_async(get_subquery_decomposer_chain().ainvoke(original_query))
+        )
         logger.info(f"Decomposed sub-queries: {sub_queries}")
         return sub_queries
     except Exception as e:
         logger.error(f"Error in query decomposition: {str(e)}")
         return []  # Return an empty list if an error occurs
+
+# Single-call Query Transformation
+class QueryTransformation(BaseModel):
+    rewritten_query: str = Field(description="The original query rewritten to be more specific, detailed, and likely to retrieve relevant information.")
+    step_back_query: str = Field(description="A broader, more general query that helps retrieve relevant background information.")
+    sub_queries: list[str] = Field(description="2-4 simpler sub-queries that, when answered together, provide a comprehensive response to the original query.")
+
+query_transformation_template = """You are an AI assistant tasked with transforming user queries to improve retrieval in a RAG system.
+Given the original query, produce all of the following:
+1. A rewritten query that is more specific, detailed, and likely to retrieve relevant information.
+2. A step-back query that is more general and can help retrieve relevant background information.
+3. 2-4 simpler sub-queries that, when answered together, would provide a comprehensive response to the original query.
+
+Original query: {original_query}"""
+query_transformation_prompt = PromptTemplate(input_variables=["original_query"], template=query_transformation_template)
+# The output schema shapes the response too, so it is part of the cache key
+query_transformation_cache_template = query_transformation_template + json.dumps(QueryTransformation.model_json_schema(), sort_keys=True)
+
+@cache
+def get_query_transformation_chain():
+    return with_resilience(
+        query_transformation_prompt | get_chat_model(MODEL_NAME, temperature=0).with_structured_output(QueryTransformation),
+        "transformation"
+    )
+
+def _transformation_fallback(original_query: str) -> dict:
+    # Same fallbacks as the individual transformation helpers
+    return {"rewritten_query": original_query, "step_back_query": original_query, "sub_queries": []}
+
+def transform_query(original_query: str) -> dict:
+    try:
+        logger.info(f"Transforming query: {original_query}")
+        transformed = cached_llm_call(
+            "transform", MODEL_NAME, query_transformation_cache_template, original_query,
+            lambda: get_query_transformation_chain().invoke(original_query).model_dump()
+        )
+        logger.info(f"Transformed query: {transformed}")
+        return transformed
+    except Exception as e:
+        logger.error(f"Error in single-call query transformation: {str(e)}")
+        return _transformation_fallback(original_query)
+
+async def atransform_query(original_query: str) -> dict:
+    try:
+        logger.info(f"Transforming query: {original_query}")
+        transformed = await acached_llm_call(
+            "transform", MODEL_NAME, query_transformation_cache_template, original_query,
+            lambda: _model_dump(get_query_transformation_chain().ainvoke(original_query))
+        )
+        logger.info(f"Transformed query: {transformed}")
+        return transformed
+    except Exception as e:
+        logger.error(f"Error in single-call query transformation: {str(e)}")
+        return _transformation_fallback(original_query)
@@ -0,0 +1,540 @@
+# src/resilience.py
+import asyncio
+import contextvars
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cache
+from typing import List, Optional
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import patch_config
+from src.configs.config import RESILIENCE_ENABLED, RESILIENCE_DEADLINES, RESILIENCE_MAX_ATTEMPTS, RESILIENCE_MAX_WORKERS
+from src.configs.config import RESILIENCE_BACKOFF_BASE_SECONDS, RESILIENCE_BACKOFF_MAX_SECONDS, CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET_SECONDS
+from src.configs.config import HEDGED_STAGES, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES
+from src.metrics import Histogram, record_resilience
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Deadlines, retries with jittered exponential backoff, a circuit breaker and
+# optional hedging for calls to the model and vector store APIs. Each stage
+# ("transformation", "summarization", "generation", "embeddings",
+# "vector_query", "upsert") has one shared ResiliencePolicy per process. When
+# a call still fails, its exception reaches the caller's existing fallback.
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class DeadlineExceededError(TimeoutError):
+    pass
+
+class AttemptAbandonedError(RuntimeError):
+    pass
+
+# Client errors other than these mean the request itself is wrong, so a retry
+# would fail the same way
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+NON_RETRYABLE_ERRORS = (CircuitOpenError, TypeError, AttributeError, KeyError, NotImplementedError)
+
+def _status_code(error) -> Optional[int]:
+    # OpenAI errors carry status_code, Pinecone errors status, httpx errors a response
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, NON_RETRYABLE_ERRORS):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return True
+
+def backoff_delay(attempt: int, base: float = RESILIENCE_BACKOFF_BASE_SECONDS, max_delay: float = RESILIENCE_BACKOFF_MAX_SECONDS) -> float:
+    # "Full jitter": a uniform delay up to the exponential bound, so clients
+    # that failed together do not retry together
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive failures and rejects calls for
+    # reset_seconds; then one trial call is let through, and its outcome
+    # closes the circuit or opens it again. A trial that never reports back
+    # (e.g. a cancelled call) is replaced by a new one after reset_seconds.
+
+    def __init__(self, failure_threshold: int = CIRCUIT_BREAKER_FAILURES, reset_seconds: float = CIRCUIT_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state != "closed" and now - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+def _get_executor(kind: str = "calls") -> ThreadPoolExecutor:
+    # Sync calls with a deadline or a hedge run on the "calls" threads so the
+    # caller can stop waiting; an abandoned call finishes in the background.
+    # Streams wait for their first chunk on a separate "streams" pool.
+    executor = _executors.get(kind)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=RESILIENCE_MAX_WORKERS, thread_name_prefix=f"resilience-{kind}")
+                _executors[kind] = executor
+    return executor
+
+def _close(stream) -> None:
+    if hasattr(stream, "close"):
+        stream.close()
+
+class ResiliencePolicy:
+    def __init__(
+        self,
+        stage: str,
+        deadline_seconds: Optional[float] = None,
+        max_attempts: int = RESILIENCE_MAX_ATTEMPTS,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: bool = False,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES
+    ):
+        self.stage = stage
+        self.deadline_seconds = deadline_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = Histogram()
+        self.counters = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "short_circuits": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _observe(self, seconds: float) -> None:
+        with self._lock:
+            self.latencies.observe(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        # Seconds to wait before sending a duplicate; None until enough
+        # successful calls have been seen to know what slow means
+        if not self.hedge:
+            return None
+        with self._lock:
+            if self.latencies.count < self.hedge_min_samples:
+                return None
+            return self.latencies.percentile(self.hedge_percentile)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "circuit": self.breaker.state,
+                "p50": self.latencies.percentile(50),
+                "p99": self.latencies.percentile(99),
+            }
+
+    def _deadline(self) -> Optional[float]:
+        return time.monotonic() + self.deadline_seconds if self.deadline_seconds else None
+
+    def _before_attempt(self, deadline: Optional[float]) -> Optional[float]:
+        # Returns the time left for the attempt
+        if not self.breaker.allow():
+            self._count("short_circuits")
+            raise CircuitOpenError(f"Circuit open for {self.stage} calls")
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._count("timeouts")
+            raise DeadlineExceededError(f"{self.stage} call exceeded its {self.deadline_seconds}s deadline")
+        return remaining
+
+    def _after_failure(self, error: Exception, attempt: int, deadline: Optional[float]) -> float:
+        # Returns the backoff before the next attempt, or re-raises when the
+        # error is final
+        if isinstance(error, DeadlineExceededError):
+            self._count("timeouts")
+        retryable = is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        elif _status_code(error) is not None:
+            # A 4xx: the upstream answered, it just rejected this request; that
+            # also resolves a half-open trial. Local errors such as a TypeError
+            # say nothing about the upstream and leave the breaker as it is.
+            self.breaker.record_success()
+        delay = backoff_delay(attempt)
+        if not retryable or attempt + 1 >= self.max_attempts or (deadline is not None and time.monotonic() + delay >= deadline):
+            self._count("failures")
+            raise error
+        logger.warning(f"Retrying {self.stage} call in {delay:.2f}s after attempt {attempt + 1} of {self.max_attempts} failed: {type(error).__name__}: {str(error)}")
+        self._count("retries")
+        record_resilience(retries=1)
+        return delay
+
+    def _on_hedge(self) -> None:
+        logger.info(f"Hedging slow {self.stage} call")
+        self._count("hedges")
+        record_resilience(hedges=1)
+
+    def call(self, func, *args, **kwargs):
+        self._count("calls")
+        deadline = self._deadline()
+        for attempt in range(self.max_attempts):
+            timeout = self._before_attempt(deadline)
+            start = time.perf_counter()
+            try:
+                result = self._attempt(func, args, kwargs, timeout)
+            except Exception as e:
+                time.sleep(self._after_failure(e, attempt, deadline))
+                continue
+            self.breaker.record_success()
+            self._observe(time.perf_counter() - start)
+            return result
+
+    def _submit(self, func, args, kwargs):
+        # Each request runs in its own copy of the caller's context, so metrics
+        # and LangChain callbacks still reach the running node
+        return _get_executor().submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+    def _attempt(self, func, args, kwargs, timeout: Optional[float]):
+        hedge_delay = self.hedge_delay()
+        if timeout is None and hedge_delay is None:
+            return func(*args, **kwargs)
+
+        end = None if timeout is None else time.monotonic() + timeout
+        futures = [self._submit(func, args, kwargs)]
+        try:
+            if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+                done, _ = wait(futures, timeout=hedge_delay)
+                if not done:
+                    self._on_hedge()
+                    futures.append(self._submit(func, args, kwargs))
+
+            # The first successful response wins; an error only counts once
+            # every request of the attempt has failed
+            pending = set(futures)
+            error = None
+            while pending:
+                remaining = None if end is None else max(0.0, end - time.monotonic())
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceededError(f"{self.stage} call exceeded its {self.deadline_seconds}s deadline")
+                for future in done:
+                    if future.exception() is None:
+                        if future is not futures[0]:
+                            self._count("hedge_wins")
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stream(self, func, *args, **kwargs):
+        # Streaming counterpart of call. Only a failure before the first chunk
+        # is retried, as a retry after it would repeat text the reader has
+        # already seen, and the deadline bounds the time to the first chunk.
+        # func(*args, abandoned=event, **kwargs) returns the iterator; the event
+        # is set once the attempt is given up so it can stop producing.
+        self._count("calls")
+        deadline = self._deadline()
+        for attempt in range(self.max_attempts):
+            timeout = self._before_attempt(deadline)
+            start = time.perf_counter()
+            abandoned = threading.Event()
+            chunks = self._stream_attempt(func, args, kwargs, abandoned, timeout)
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self.breaker.record_success()
+                return
+            except Exception as e:
+                abandoned.set()
+                time.sleep(self._after_failure(e, attempt, deadline))
+                continue
+            self.breaker.record_success()
+            self._observe(time.perf_counter() - start)
+            try:
+                yield first
+                yield from chunks
+            except Exception as e:
+                self._count("failures")
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                raise
+            finally:
+                # Also stops the attempt when the consumer closes the stream early
+                abandoned.set()
+            return
+
+    def _stream_attempt(self, func, args, kwargs, abandoned: threading.Event, timeout: Optional[float]):
+        if timeout is None:
+            yield from func(*args, abandoned=abandoned, **kwargs)
+            return
+
+        # Only the wait for the first chunk runs on a worker, on a pool of its
+        # own so streams never queue ahead of short calls. Once the first chunk
+        # arrives the stream is handed back and read on the caller's thread.
+        handoff = queue.Queue()
+        handoff_lock = threading.Lock()
+
+        def read_first():
+            stream = iter(func(*args, abandoned=abandoned, **kwargs))
+            try:
+                chunk = next(stream, _END)
+            except Exception as e:
+                handoff.put((None, None, e))
+                return
+            with handoff_lock:
+                if not abandoned.is_set():
+                    handoff.put((stream, chunk, None))
+                    return
+            _close(stream)
+
+        _get_executor("streams").submit(contextvars.copy_context().run, read_first)
+        try:
+            stream, chunk, error = handoff.get(timeout=timeout)
+        except queue.Empty:
+            with handoff_lock:
+                abandoned.set()
+            if not handoff.empty():
+                stream, _, _ = handoff.get_nowait()
+                if stream is not None:
+                    _close(stream)
+            raise DeadlineExceededError(f"{self.stage} call sent nothing within its {self.deadline_seconds}s deadline")
+        if error is not None:
+            raise error
+        try:
+            if chunk is _END:
+                return
+            yield chunk
+            yield from stream
+        finally:
+            _close(stream)
+
+    async def acall(self, afunc, *args, **kwargs):
+        # Async counterpart of call; requests that lose a hedge or run past the
+        # deadline are cancelled
+        self._count("calls")
+        deadline = self._deadline()
+        for attempt in range(self.max_attempts):
+            timeout = self._before_attempt(deadline)
+            start = time.perf_counter()
+            try:
+                result = await self._aattempt(afunc, args, kwargs, timeout)
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(e, attempt, deadline))
+                continue
+            self.breaker.record_success()
+            self._observe(time.perf_counter() - start)
+            return result
+
+    async def _aattempt(self, afunc, args, kwargs, timeout: Optional[float]):
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is None:
+            try:
+                return await asyncio.wait_for(afunc(*args, **kwargs), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError(f"{self.stage} call exceeded its {self.deadline_seconds}s deadline")
+
+        end = None if timeout is None else time.monotonic() + timeout
+        tasks = [asyncio.ensure_future(afunc(*args, **kwargs))]
+        try:
+            if timeout is None or hedge_delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self._on_hedge()
+                    tasks.append(asyncio.ensure_future(afunc(*args, **kwargs)))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                remaining = None if end is None else max(0.0, end - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceededError(f"{self.stage} call exceeded its {self.deadline_seconds}s deadline")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, afunc, *args, **kwargs):
+        # Async counterpart of stream; afunc returns an async iterator, and an
+        # attempt that misses the deadline is cancelled
+        self._count("calls")
+        deadline = self._deadline()
+        for attempt in range(self.max_attempts):
+            timeout = self._before_attempt(deadline)
+            start = time.perf_counter()
+            chunks = afunc(*args, **kwargs).__aiter__()
+            try:
+                try:
+                    first = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except asyncio.TimeoutError:
+                    raise DeadlineExceededError(f"{self.stage} call sent nothing within its {self.deadline_seconds}s deadline")
+            except StopAsyncIteration:
+                self.breaker.record_success()
+                return
+            except Exception as e:
+                if hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                await asyncio.sleep(self._after_failure(e, attempt, deadline))
+                continue
+            self.breaker.record_success()
+            self._observe(time.perf_counter() - start)
+            try:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            except Exception as e:
+                self._count("failures")
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                raise
+            finally:
+                if hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+            return
+
+_END = object()
+
+def _stage_settings(value: str) -> dict:
+    # "embeddings=10,vector_query=5" -> {"embeddings": 10.0, "vector_query": 5.0}
+    settings = {}
+    for pair in value.split(","):
+        if "=" in pair:
+            stage, seconds = pair.split("=", 1)
+            settings[stage.strip()] = float(seconds)
+    return settings
+
+_deadlines = _stage_settings(RESILIENCE_DEADLINES)
+_hedged_stages = {stage.strip() for stage in HEDGED_STAGES.split(",") if stage.strip()}
+
+@cache
+def get_policy(stage: str) -> ResiliencePolicy:
+    # One policy, and so one circuit breaker and latency window, per stage and process
+    return ResiliencePolicy(stage, deadline_seconds=_deadlines.get(stage), hedge=stage in _hedged_stages)
+
+def resilience_stats() -> dict:
+    return {policy.stage: policy.stats() for policy in (get_policy(stage) for stage in sorted(_deadlines))}
+
+def resilient_call(stage: str, func, *args, **kwargs):
+    if not RESILIENCE_ENABLED:
+        return func(*args, **kwargs)
+    return get_policy(stage).call(func, *args, **kwargs)
+
+async def aresilient_call(stage: str, afunc, *args, **kwargs):
+    if not RESILIENCE_ENABLED:
+        return await afunc(*args, **kwargs)
+    return await get_policy(stage).acall(afunc, *args, **kwargs)
+
+class _AbandonedAttemptGate(BaseCallbackHandler):
+    # Runs ahead of the other callback handlers of a streaming attempt. Once
+    # the attempt is abandoned its next token raises here, so it never reaches
+    # the UI's handlers, and the error ends the model's stream
+    raise_error = True
+    run_inline = True
+
+    def __init__(self, abandoned: threading.Event):
+        self.abandoned = abandoned
+
+    def on_llm_new_token(self, token, **kwargs) -> None:
+        if self.abandoned.is_set():
+            raise AttemptAbandonedError("Streaming attempt abandoned")
+
+def _gated_stream(runnable, inputs, config, abandoned: threading.Event):
+    gate = _AbandonedAttemptGate(abandoned)
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.handlers.insert(0, gate)
+        callbacks.inheritable_handlers.insert(0, gate)
+    else:
+        callbacks = [gate, *(callbacks or [])]
+    return runnable.stream(inputs, patch_config(config, callbacks=callbacks))
+
+def with_resilience(runnable, stage: str, streaming: bool = False):
+    # Wraps a chain so every invoke/ainvoke, and so every item of batch/abatch,
+    # runs under the stage's policy. With streaming=True the chain's chunks
+    # are passed through as they arrive, and only a failure before the first
+    # one is retried (see ResiliencePolicy.stream).
+    if not RESILIENCE_ENABLED:
+        return runnable
+
+    if streaming:
+        def stream(inputs, config):
+            yield from get_policy(stage).stream(_gated_stream, runnable, inputs, config)
+
+        async def astream(inputs, config):
+            async for chunk in get_policy(stage).astream(runnable.astream, inputs, config):
+                yield chunk
+
+        return RunnableLambda(stream, afunc=astream, name=f"resilient_{stage}")
+
+    def invoke(inputs, config):
+        return get_policy(stage).call(runnable.invoke, inputs, config)
+
+    async def ainvoke(inputs, config):
+        return await get_policy(stage).acall(runnable.ainvoke, inputs, config)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"resilient_{stage}")
+
+class ResilientEmbeddings(Embeddings):
+    # Wraps the embeddings client so every request to the API runs under the
+    # "embeddings" policy; embedding a text is idempotent, so it may be hedged
+
+    def __init__(self, embeddings: Embeddings, stage: str = "embeddings"):
+        self.embeddings = embeddings
+        self.stage = stage
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return resilient_call(self.stage, self.embeddings.embed_documents, texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await aresilient_call(self.stage, self.embeddings.aembed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return resilient_call(self.stage, self.embeddings.embed_query, text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await aresilient_call(self.stage, self.embeddings.aembed_query, text)
@@ -0,0 +1,183 @@
+# src/retrieval.py
+import asyncio
+import contextvars
+import logging
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+from src.configs.config import RETRIEVAL_MAX_CONCURRENCY, RETRIEVAL_MAX_WORKERS, RETRIEVAL_MODE, RETRIEVAL_K, RETRIEVAL_FETCH_K
+from src.configs.config import RETRIEVAL_MIN_K, RETRIEVAL_MAX_K, RETRIEVAL_SCORE_THRESHOLD, RETRIEVAL_RELATIVE_GAP
+from src.configs.config import METADATA_FILTER_FIELDS, METADATA_FILTER_FALLBACK, CONTENT_TYPE_NAMESPACES
+from src.metrics import record_retrieval
+from src.resilience import resilient_call, aresilient_call
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    # One pool for the sub-query searches of every request, created on first use
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval")
+    return _executor
+
+def fetch_k(mode: str = RETRIEVAL_MODE) -> int:
+    # Adaptive mode over-fetches so the cutoff can keep more than the fixed k
+    # without a second round trip
+    return max(RETRIEVAL_FETCH_K, RETRIEVAL_MAX_K) if mode == "adaptive" else RETRIEVAL_K
+
+def adaptive_cutoff(
+    results: list,
+    min_k: int = RETRIEVAL_MIN_K,
+    max_k: int = RETRIEVAL_MAX_K,
+    score_threshold: float = RETRIEVAL_SCORE_THRESHOLD,
+    relative_gap: float = RETRIEVAL_RELATIVE_GAP
+) -> list:
+    # Keeps the leading (document, score) pairs while they score above the
+    # threshold and no score falls more than relative_gap below the previous
+    # one; the first min_k are kept regardless, and never more than max_k
+    results = sorted(results, key=lambda result: result[1], reverse=True)
+    kept = []
+    for document, score in results[:max_k]:
+        if len(kept) >= min_k:
+            if score < score_threshold:
+                break
+            previous = kept[-1][1]
+            if previous > 0 and (previous - score) / previous > relative_gap:
+                break
+        kept.append((document, score))
+    return kept
+
+def build_search_kwargs(metadata: Optional[dict]) -> dict:
+    # Turns the request metadata (content type and keywords from the form) into
+    # a Pinecone-style metadata filter and, optionally, a namespace per content type
+    metadata = metadata or {}
+    content_type = metadata.get("content_type")
+    keywords = [keyword.strip() for keyword in metadata.get("keywords") or [] if keyword and keyword.strip()]
+    fields = {field.strip() for field in METADATA_FILTER_FIELDS.split(",") if field.strip()}
+
+    search_kwargs = {}
+    filter = {}
+    if content_type and CONTENT_TYPE_NAMESPACES:
+        # The namespace already narrows the search to this content type
+        search_kwargs["namespace"] = content_type_namespace(content_type)
+    elif content_type and "content_type" in fields:
+        filter["content_type"] = {"$eq": content_type}
+    if keywords and "keywords" in fields:
+        filter["keywords"] = {"$in": keywords}
+    if filter:
+        search_kwargs["filter"] = filter
+    return search_kwargs
+
+def content_type_namespace(content_type: str) -> str:
+    # "Step-by-Step Tutorial" -> "step-by-step-tutorial"
+    return re.sub(r"[^a-z0-9]+", "-", content_type.lower()).strip("-")
+
+def _search(vector_store, embedding: list[float], k: int, search_kwargs: dict):
+    # Vector queries are read-only, so the "vector_query" policy may hedge them
+    return resilient_call("vector_query", vector_store.similarity_search_by_vector_with_score, embedding, k=k, **search_kwargs)
+
+def _search_by_vector(vector_store, sub_query: str, embedding: list[float], k: int, search_kwargs: Optional[dict] = None):
+    start = time.perf_counter()
+    try:
+        logger.info(f"Retrieving documents for sub-query: {sub_query}")
+        results = _search(vector_store, embedding, k, search_kwargs or {})
+        if not results and search_kwargs and METADATA_FILTER_FALLBACK:
+            logger.info(f"No documents match {search_kwargs}, searching without metadata filters: {sub_query}")
+            record_retrieval(1, time.perf_counter() - start)
+            start = time.perf_counter()
+            results = _search(vector_store, embedding, k, {})
+        return results
+    except Exception as e:
+        logger.error(f"Error during retrieval for sub-query '{sub_query}': {str(e)}")
+        return []
+    finally:
+        record_retrieval(1, time.perf_counter() - start)
+
+async def _asearch_once(vector_store, embedding: list[float], k: int, search_kwargs: dict):
+    search = getattr(vector_store, "asimilarity_search_by_vector_with_score", None)
+    if search is not None:
+        return await search(embedding, k=k, **search_kwargs)
+    return await asyncio.to_thread(vector_store.similarity_search_by_vector_with_score, embedding, k=k, **search_kwargs)
+
+async def _asearch(vector_store, embedding: list[float], k: int, search_kwargs: dict):
+    return await aresilient_call("vector_query", _asearch_once, vector_store, embedding, k, search_kwargs)
+
+async def _asearch_by_vector(vector_store, sub_query: str, embedding: list[float], k: int, search_kwargs: Optional[dict] = None):
+    start = time.perf_counter()
+    try:
+        logger.info(f"Retrieving documents for sub-query: {sub_query}")
+        results = await _asearch(vector_store, embedding, k, search_kwargs or {})
+        if not results and search_kwargs and METADATA_FILTER_FALLBACK:
+            logger.info(f"No documents match {search_kwargs}, searching without metadata filters: {sub_query}")
+            record_retrieval(1, time.perf_counter() - start)
+            start = time.perf_counter()
+            results = await _asearch(vector_store, embedding, k, {})
+        return results
+    except Exception as e:
+        logger.error(f"Error during retrieval for sub-query '{sub_query}': {str(e)}")
+        return []
+    finally:
+        record_retrieval(1, time.perf_counter() - start)
+
+def retrieve_sub_queries(vector_store, embeddings, sub_queries: list[str], k: int = 2, max_concurrency: int = RETRIEVAL_MAX_CONCURRENCY, search_kwargs: Optional[dict] = None) -> list[list]:
+    # Returns (document, score) pairs per sub-query. A failed sub-query yields
+    # an empty result list instead of failing the others. search_kwargs (filter,
+    # namespace) is passed to every vector query
+    if not sub_queries:
+        return []
+
+    # Embed every sub-query of the turn in one batched request
+    try:
+        sub_query_embeddings = embeddings.embed_documents(sub_queries)
+    except Exception as e:
+        logger.error(f"Error embedding sub-queries: {str(e)}")
+        return [[] for _ in sub_queries]
+
+    # Each search runs in a copy of the caller's context so metrics reach the
+    # running node. At most max_concurrency searches of this request are in
+    # the shared pool at once, and results keep the sub-query order.
+    executor = _get_executor()
+    max_in_flight = max(1, max_concurrency)
+    results = [None] * len(sub_queries)
+    in_flight = {}
+    for i, (sub_query, embedding) in enumerate(zip(sub_queries, sub_query_embeddings)):
+        if len(in_flight) >= max_in_flight:
+            _collect(wait(in_flight, return_when=FIRST_COMPLETED).done, in_flight, results)
+        future = executor.submit(contextvars.copy_context().run, _search_by_vector, vector_store, sub_query, embedding, k, search_kwargs)
+        in_flight[future] = i
+    _collect(wait(in_flight).done, in_flight, results)
+    return results
+
+def _collect(done, in_flight: dict, results: list) -> None:
+    # _search_by_vector returns [] on failure, so result() does not raise
+    for future in done:
+        results[in_flight.pop(future)] = future.result()
+
+async def aretrieve_sub_queries(vector_store, embeddings, sub_queries: list[str], k: int = 2, max_concurrency: int = RETRIEVAL_MAX_CONCURRENCY, search_kwargs: Optional[dict] = None) -> list[list]:
+    # Async counterpart of retrieve_sub_queries with the same ordering and
+    # failure semantics; a semaphore bounds the searches in flight
+    if not sub_queries:
+        return []
+
+    try:
+        sub_query_embeddings = await embeddings.aembed_documents(sub_queries)
+    except Exception as e:
+        logger.error(f"Error embedding sub-queries: {str(e)}")
+        return [[] for _ in sub_queries]
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def search(sub_query, embedding):
+        async with semaphore:
+            return await _asearch_by_vector(vector_store, sub_query, embedding, k, search_kwargs)
+
+    # gather returns results in argument order
+    return list(await asyncio.gather(*(search(sub_query, embedding) for sub_query, embedding in zip(sub_queries, sub_query_embeddings))))
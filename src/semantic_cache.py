@@ -0,0 +1,327 @@
+# src/semantic_cache.py
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Optional
+import numpy as np
+from langchain_core.messages import AIMessageChunk
+from src.retrieval import build_search_kwargs
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    # Stores final responses next to the unit-normalized embedding of the query
+    # that produced them. An optional scope (such as the request's metadata
+    # filters) partitions the entries: a lookup only matches entries stored
+    # under the same scope.
+    #
+    # A lookup scores every live entry against a low-dimensional random
+    # projection ("sketch") of the embeddings, which preserves cosine
+    # similarity closely enough to shortlist candidates, then rescores the
+    # shortlist exactly against the full vectors (kept as float16). The scan
+    # runs on a snapshot outside the lock, so sessions do not serialize on it.
+    # Sketch scores carry an error of about sqrt(2 / sketch_dims), so the
+    # shortlist has to be wide enough that a true duplicate is not crowded out
+    # by many near-miss rephrasings of the same topic.
+
+    def __init__(self, embeddings, similarity_threshold: float = 0.95, ttl_seconds: float = 86400, max_entries: int = 50000, sketch_dims: int = 256, candidates: int = 128):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sketch_dims = sketch_dims
+        self.candidates = candidates
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None  # allocated on first insert, once the dimension is known
+        self._sketches = None
+        self._projection = None
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_access = np.zeros(max_entries, dtype=np.float64)
+        self._responses = [None] * max_entries
+        self._scope_ids = np.zeros(max_entries, dtype=np.int64)
+        self._scopes = {}  # scope key -> id stored in _scope_ids
+        self._scope_keys = {}  # id -> scope key, for ids still in use
+        self._scope_counts = {}  # id -> number of slots holding it
+        self._next_scope_id = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, queries: list) -> np.ndarray:
+        # One batched embeddings call for the queries of a batch
+        vectors = np.asarray(self.embeddings.embed_documents(queries), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _sketch(self, vector: np.ndarray) -> np.ndarray:
+        return np.asarray(vector, dtype=np.float32) @ self._projection
+
+    def lookup(self, query: str, query_vector: Optional[np.ndarray] = None, scope: Optional[str] = None) -> Optional[str]:
+        if query_vector is None:
+            query_vector = self.embed(query)
+
+        with self._lock:
+            size = self._size
+            scope_id = self._scopes.get(scope)
+            if size == 0 or scope_id is None:
+                self.misses += 1
+                return None
+            sketches, scope_ids, created_at = self._sketches, self._scope_ids, self._created_at
+
+        # Shortlist on the sketches; slots overwritten meanwhile are caught by
+        # the exact rescoring below
+        now = time.time()
+        scores = sketches[:size] @ self._sketch(query_vector)
+        scores[(scope_ids[:size] != scope_id) | (created_at[:size] < now - self.ttl_seconds)] = -np.inf
+        shortlist = np.argpartition(-scores, self.candidates - 1)[:self.candidates] if size > self.candidates else np.arange(size)
+        shortlist = shortlist[np.isfinite(scores[shortlist])]
+
+        with self._lock:
+            live = shortlist[(self._scope_ids[shortlist] == scope_id) & (self._created_at[shortlist] >= now - self.ttl_seconds)]
+            exact = self._vectors[live].astype(np.float32) @ query_vector if live.size else np.empty(0, dtype=np.float32)
+            if not exact.size or exact.max() < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            best = int(live[np.argmax(exact)])
+            self._last_access[best] = now
+            self.hits += 1
+            logger.info(f"Semantic cache hit (similarity {exact.max():.4f}) for query: {query}")
+            return self._responses[best]
+
+    def add(self, query: str, response: str, query_vector: Optional[np.ndarray] = None, scope: Optional[str] = None) -> None:
+        if query_vector is None:
+            query_vector = self.embed(query)
+
+        with self._lock:
+            if self._vectors is None:
+                dimension = query_vector.shape[0]
+                self._vectors = np.zeros((self.max_entries, dimension), dtype=np.float16)
+                self._sketches = np.zeros((self.max_entries, self.sketch_dims), dtype=np.float32)
+                # Fixed-seed Gaussian projection, scaled so sketch dot products
+                # estimate the cosine similarity
+                projection = np.random.default_rng(0).standard_normal((dimension, self.sketch_dims)) / np.sqrt(self.sketch_dims)
+                self._projection = projection.astype(np.float32)
+
+            now = time.time()
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # Reuse an expired slot if there is one, otherwise the least recently used
+                expired = np.flatnonzero(self._created_at < now - self.ttl_seconds)
+                slot = int(expired[0]) if expired.size else int(np.argmin(self._last_access))
+                self._release_scope(int(self._scope_ids[slot]))
+
+            self._vectors[slot] = query_vector
+            self._sketches[slot] = self._sketch(query_vector)
+            self._created_at[slot] = now
+            self._last_access[slot] = now
+            self._responses[slot] = response
+            self._scope_ids[slot] = self._acquire_scope(scope)
+
+    def _acquire_scope(self, scope: Optional[str]) -> int:
+        # Ids are never reused, so a lookup holding a stale id matches nothing
+        scope_id = self._scopes.get(scope)
+        if scope_id is None:
+            scope_id = self._next_scope_id
+            self._next_scope_id += 1
+            self._scopes[scope] = scope_id
+            self._scope_keys[scope_id] = scope
+        self._scope_counts[scope_id] = self._scope_counts.get(scope_id, 0) + 1
+        return scope_id
+
+    def _release_scope(self, scope_id: int) -> None:
+        # Forget a scope once no slot holds it, so _scopes stays bounded
+        count = self._scope_counts[scope_id] - 1
+        if count:
+            self._scope_counts[scope_id] = count
+            return
+        del self._scope_counts[scope_id]
+        del self._scopes[self._scope_keys.pop(scope_id)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+def _extract_query(inputs: dict) -> Optional[str]:
+    if inputs.get("initial_query"):
+        return inputs["initial_query"]
+    messages = inputs.get("messages") or []
+    if not messages:
+        return None
+    # The query is the last message; new_request() puts a RemoveMessage first
+    message = messages[-1]
+    # Messages may be passed as ("user", content) tuples or as message objects
+    if isinstance(message, tuple):
+        return message[1]
+    return getattr(message, "content", None)
+
+def _extract_scope(inputs: dict) -> Optional[str]:
+    # Answers depend on the filters and namespace the metadata turns into, so
+    # those are the cache scope; metadata that filters nothing (such as fields
+    # missing from METADATA_FILTER_FIELDS) must not split the cache
+    search_kwargs = build_search_kwargs(inputs.get("metadata"))
+    return json.dumps(search_kwargs, sort_keys=True) if search_kwargs else None
+
+def _final_response(mode: str, chunk) -> Optional[str]:
+    if mode == "updates":
+        for value in chunk.values():
+            if isinstance(value, dict) and value.get("final_response"):
+                return value["final_response"]
+    elif mode == "values" and chunk.get("final_response"):
+        return chunk["final_response"]
+    return None
+
+class SemanticCachedGraph:
+    # Wraps a compiled graph so near-duplicate queries are answered from the
+    # cache without running any node. invoke, stream, batch and their async
+    # counterparts go through the cache; other ways of running the graph are
+    # refused rather than silently bypassing it, and everything else (such as
+    # get_state) is delegated to the graph.
+
+    UNCACHED_RUN_METHODS = {"astream_events", "astream_log", "batch_as_completed", "abatch_as_completed", "transform", "atransform"}
+
+    def __init__(self, graph, cache: SemanticCache):
+        self.graph = graph
+        self.cache = cache
+
+    def __getattr__(self, name):
+        if name in self.UNCACHED_RUN_METHODS:
+            raise AttributeError(f"{name} would bypass the semantic cache; use the graph attribute to call it uncached")
+        return getattr(self.graph, name)
+
+    def _lookup(self, inputs: dict):
+        query = _extract_query(inputs)
+        if not query:
+            return None, None, None
+        try:
+            query_vector = self.cache.embed(query)
+            return query, query_vector, self.cache.lookup(query, query_vector, _extract_scope(inputs))
+        except Exception as e:
+            logger.error(f"Error during semantic cache lookup: {str(e)}")
+            return None, None, None
+
+    def _lookup_many(self, inputs: list) -> list:
+        queries = [_extract_query(item) for item in inputs]
+        lookups = [(None, None, None)] * len(inputs)
+        indexes = [i for i, query in enumerate(queries) if query]
+        if not indexes:
+            return lookups
+        try:
+            vectors = self.cache.embed_many([queries[i] for i in indexes])
+            for i, vector in zip(indexes, vectors):
+                lookups[i] = (queries[i], vector, self.cache.lookup(queries[i], vector, _extract_scope(inputs[i])))
+        except Exception as e:
+            logger.error(f"Error during semantic cache lookup: {str(e)}")
+        return lookups
+
+    def _store(self, inputs: dict, query, query_vector, response) -> None:
+        if query is None or not response:
+            return
+        try:
+            self.cache.add(query, response, query_vector, _extract_scope(inputs))
+        except Exception as e:
+            logger.error(f"Error storing response in semantic cache: {str(e)}")
+
+    def _cached_events(self, cached_response: str, modes: list):
+        # Replay a cached answer in the shape the requested stream modes produce,
+        # as if the final generation node had emitted it
+        if "messages" in modes:
+            yield "messages", (AIMessageChunk(content=cached_response), {"langgraph_node": "final_generation"})
+        if "updates" in modes:
+            yield "updates", {"final_generation": {"final_response": cached_response}}
+        if "values" in modes:
+            yield "values", {"final_response": cached_response}
+
+    def stream(self, inputs: dict, config=None, stream_mode="updates", **kwargs):
+        # stream_mode may be a single mode or a list, in which case LangGraph
+        # yields (mode, chunk) tuples
+        multiple_modes = isinstance(stream_mode, list)
+        modes = stream_mode if multiple_modes else [stream_mode]
+
+        query, query_vector, cached_response = self._lookup(inputs)
+        if cached_response is not None:
+            for mode, chunk in self._cached_events(cached_response, modes):
+                yield (mode, chunk) if multiple_modes else chunk
+            return
+
+        final_response = None
+        for output in self.graph.stream(inputs, config, stream_mode=stream_mode, **kwargs):
+            mode, chunk = output if multiple_modes else (stream_mode, output)
+            final_response = _final_response(mode, chunk) or final_response
+            yield output
+
+        self._store(inputs, query, query_vector, final_response)
+
+    async def astream(self, inputs: dict, config=None, stream_mode="updates", **kwargs):
+        multiple_modes = isinstance(stream_mode, list)
+        modes = stream_mode if multiple_modes else [stream_mode]
+
+        query, query_vector, cached_response = await asyncio.to_thread(self._lookup, inputs)
+        if cached_response is not None:
+            for mode, chunk in self._cached_events(cached_response, modes):
+                yield (mode, chunk) if multiple_modes else chunk
+            return
+
+        final_response = None
+        async for output in self.graph.astream(inputs, config, stream_mode=stream_mode, **kwargs):
+            mode, chunk = output if multiple_modes else (stream_mode, output)
+            final_response = _final_response(mode, chunk) or final_response
+            yield output
+
+        await asyncio.to_thread(self._store, inputs, query, query_vector, final_response)
+
+    def invoke(self, inputs: dict, *args, **kwargs):
+        query, query_vector, cached_response = self._lookup(inputs)
+        if cached_response is not None:
+            return {"final_response": cached_response}
+
+        result = self.graph.invoke(inputs, *args, **kwargs)
+        self._store(inputs, query, query_vector, result.get("final_response"))
+        return result
+
+    async def ainvoke(self, inputs: dict, *args, **kwargs):
+        # Lookups embed the query and take the cache lock, so run them off the event loop
+        query, query_vector, cached_response = await asyncio.to_thread(self._lookup, inputs)
+        if cached_response is not None:
+            return {"final_response": cached_response}
+
+        result = await self.graph.ainvoke(inputs, *args, **kwargs)
+        await asyncio.to_thread(self._store, inputs, query, query_vector, result.get("final_response"))
+        return result
+
+    def _merge_batch(self, inputs: list, config, lookups: list):
+        # Cached answers are filled in; the rest of the batch goes to the graph
+        results = [{"final_response": cached} if cached is not None else None for _, _, cached in lookups]
+        misses = [i for i, result in enumerate(results) if result is None]
+        configs = [config[i] for i in misses] if isinstance(config, list) else config
+        return results, misses, [inputs[i] for i in misses], configs
+
+    def batch(self, inputs: list, config=None, **kwargs):
+        lookups = self._lookup_many(inputs)
+        results, misses, pending, configs = self._merge_batch(inputs, config, lookups)
+        if pending:
+            for i, output in zip(misses, self.graph.batch(pending, configs, **kwargs)):
+                results[i] = output
+                if isinstance(output, dict):
+                    self._store(inputs[i], lookups[i][0], lookups[i][1], output.get("final_response"))
+        return results
+
+    async def abatch(self, inputs: list, config=None, **kwargs):
+        lookups = await asyncio.to_thread(self._lookup_many, inputs)
+        results, misses, pending, configs = self._merge_batch(inputs, config, lookups)
+        if pending:
+            for i, output in zip(misses, await self.graph.abatch(pending, configs, **kwargs)):
+                results[i] = output
+                if isinstance(output, dict):
+                    await asyncio.to_thread(self._store, inputs[i], lookups[i][0], lookups[i][1], output.get("final_response"))
+        return results
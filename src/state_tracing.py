@@ -0,0 +1,104 @@
+# src/state_tracing.py
+import atexit
+import functools
+import hashlib
+import inspect
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from src.configs.config import STATE_TRACE_MAX_FIELD_CHARS, STATE_TRACE_MAX_ITEMS, STATE_TRACE_SAMPLE_RATE
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class LazyFormat:
+    # Defers building a log string until a handler actually emits the record
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self) -> str:
+        return self.func(*self.args)
+
+def _truncate(text: str, max_chars: int) -> str:
+    if max_chars and len(text) > max_chars:
+        return f"{text[:max_chars]}... [+{len(text) - max_chars} chars]"
+    return text
+
+def format_value(value, max_chars: int = STATE_TRACE_MAX_FIELD_CHARS, max_items: int = STATE_TRACE_MAX_ITEMS) -> str:
+    # Caps both the length of each string and the number of list items shown
+    if hasattr(value, "content") and hasattr(value, "type"):
+        return f"{value.type}: {_truncate(str(value.content), max_chars)}"
+    if isinstance(value, (list, tuple)):
+        items = [format_value(item, max_chars, max_items) for item in (value[:max_items] if max_items else value)]
+        if max_items and len(value) > max_items:
+            items.append(f"... [+{len(value) - max_items} items]")
+        return "[" + ", ".join(items) + "]"
+    return _truncate(value if isinstance(value, str) else repr(value), max_chars)
+
+def format_changes(state: dict, update: dict, max_chars: int = STATE_TRACE_MAX_FIELD_CHARS, max_items: int = STATE_TRACE_MAX_ITEMS) -> str:
+    # Only the keys whose value the node changed; messages are always appended
+    changes = [
+        f"{key}={format_value(value, max_chars, max_items)}"
+        for key, value in update.items()
+        if key == "messages" or state.get(key) != value
+    ]
+    return "{" + ", ".join(changes) + "}"
+
+def format_full_state(state: dict, update: dict) -> str:
+    merged = dict(state)
+    for key, value in update.items():
+        merged[key] = list(state.get(key) or []) + list(value) if key == "messages" else value
+    return "{" + ", ".join(f"{key}={format_value(value, 0, 0)}" for key, value in merged.items()) + "}"
+
+def is_sampled(query_id, sample_rate: int = STATE_TRACE_SAMPLE_RATE) -> bool:
+    # Deterministic per query, so every node of a sampled request is traced in full
+    if not query_id or sample_rate <= 0:
+        return False
+    return int(hashlib.sha1(query_id.encode("utf-8")).hexdigest()[:8], 16) % sample_rate == 0
+
+def _trace_update(name: str, state: dict, update) -> None:
+    if isinstance(update, dict) and logger.isEnabledFor(logging.INFO):
+        if is_sampled(state.get("query_id")):
+            logger.info("Full state after %s: %s", name, LazyFormat(format_full_state, state, update))
+        else:
+            logger.info("State changes after %s: %s", name, LazyFormat(format_changes, state, update))
+
+def trace_node(name: str, func):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def traced_async_node(state):
+            update = await func(state)
+            _trace_update(name, state, update)
+            return update
+        return traced_async_node
+
+    @functools.wraps(func)
+    def traced_node(state):
+        update = func(state)
+        _trace_update(name, state, update)
+        return update
+    return traced_node
+
+class _DeferredQueueHandler(QueueHandler):
+    # The stock QueueHandler formats the message before enqueueing; leave that
+    # to the listener thread so formatting happens off the request path
+    def prepare(self, record):
+        return record
+
+_listener = None
+
+def enable_async_logging() -> None:
+    # Move the root logger's handlers behind a queue served by a background thread
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or not root.handlers:
+        return
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    _listener.start()
+    root.handlers = [_DeferredQueueHandler(log_queue)]
+    atexit.register(_listener.stop)
@@ -0,0 +1,45 @@
+# src/token_counting.py
+import logging
+import os
+import threading
+from src.configs.config import TIKTOKEN_CACHE_DIR
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = "o200k_base"  # tokenizer used by gpt-4o-mini
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+def _load_encoding():
+    # Loaded once per process; concurrent first calls wait for the one load
+    # instead of each trying the download
+    global _encoding, _encoding_failed
+    with _encoding_lock:
+        if _encoding is not None or _encoding_failed:
+            return
+        try:
+            if TIKTOKEN_CACHE_DIR:
+                os.makedirs(TIKTOKEN_CACHE_DIR, exist_ok=True)
+                os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+            import tiktoken
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:
+            # tiktoken downloads its BPE files on first use; fall back offline
+            logger.warning(f"tiktoken unavailable, approximating token counts: {str(e)}")
+            _encoding_failed = True
+
+def count_tokens(text: str) -> int:
+    if _encoding is None and not _encoding_failed:
+        _load_encoding()
+    if _encoding is None:
+        return len(text) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+if __name__ == "__main__":
+    # Downloads the encoding into TIKTOKEN_CACHE_DIR ahead of offline runs
+    logging.basicConfig(level=logging.INFO)
+    _load_encoding()
+    print(f"{ENCODING_NAME}: {'cached in ' + os.environ.get('TIKTOKEN_CACHE_DIR', '') if _encoding else 'unavailable'}")
@@ -1,3 +1,109 @@
 # src/tools_condition.py
-def tools_condition(state):
-    return "tools"  # Always use the tool
+import json
+import logging
+import os
+import re
+import threading
+from typing import Optional
+import numpy as np
+from src.configs.config import ROUTER_MAX_SIMPLE_WORDS, ROUTER_MIN_KEYWORD_DENSITY, ROUTER_FAQ_PATH, ROUTER_FAQ_THRESHOLD
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Decides, from cheap local signals, whether a query can skip query
+# transformation. Simple queries are retrieved directly with the user's query
+# as the only sub-query; complex ones go through rewriting and decomposition.
+
+STOPWORDS = frozenset("""
+a an the is are was were be been being am do does did how what which who whom whose why when where
+i me my we our you your it its this that these those there here of in on at to for from by with
+about into over under as or if then than so can could should would will shall may might must
+please tell show give explain need want know get use using make any some
+""".split())
+
+# Phrases that usually mean the question has several parts to answer
+MULTI_PART_PATTERN = re.compile(
+    r"\b(and|also|versus|vs|compare|comparison|difference|differences|between|pros|cons|trade-?offs?|step[- ]by[- ]step|both|multiple)\b|[;,?].*\?",
+    re.IGNORECASE
+)
+
+def extract_query(message_content: str) -> str:
+    # The Streamlit form sends "**Query:** ..." followed by other labelled
+    # fields; only the query itself describes what to retrieve
+    match = re.search(r"^\*\*Query:\*\*\s*(.*)$", message_content, re.MULTILINE)
+    return match.group(1).strip() if match else message_content.strip()
+
+def keyword_density(words: list[str]) -> float:
+    # Share of words that carry content; short, keyword-heavy queries are already specific
+    if not words:
+        return 0.0
+    return sum(1 for word in words if word.lower() not in STOPWORDS) / len(words)
+
+# FAQ matrices by file path, so the embeddings client is not kept as a cache key
+_faq_vectors = {}
+_faq_lock = threading.Lock()
+
+def _load_faq_vectors(embeddings, path: Optional[str]) -> Optional[np.ndarray]:
+    if not path or not os.path.exists(path):
+        return None
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["question"] if line.startswith("{") else line)
+    if not questions:
+        return None
+
+    vectors = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    logger.info(f"Loaded {len(questions)} FAQ questions for query routing")
+    return vectors / np.where(norms == 0, 1, norms)
+
+def get_faq_vectors(embeddings, path: Optional[str] = ROUTER_FAQ_PATH) -> Optional[np.ndarray]:
+    # Unit-normalized embeddings of representative FAQ questions, one per line
+    # of ROUTER_FAQ_PATH (plain text, or JSONL with a "question" field), built
+    # once per process. A failed load is not stored, so the next query retries.
+    if path in _faq_vectors:
+        return _faq_vectors[path]
+    with _faq_lock:
+        if path not in _faq_vectors:
+            _faq_vectors[path] = _load_faq_vectors(embeddings, path)
+        return _faq_vectors[path]
+
+def faq_similarity(query: str, embeddings) -> Optional[float]:
+    faq_vectors = get_faq_vectors(embeddings)
+    if faq_vectors is None:
+        return None
+    query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    norm = np.linalg.norm(query_vector)
+    return float((faq_vectors @ (query_vector / norm if norm else query_vector)).max())
+
+def classify_query(query: str, embeddings=None) -> str:
+    words = re.findall(r"[\w'-]+", query)
+
+    # Long queries always get the full treatment, without an embedding call
+    if len(words) > ROUTER_MAX_SIMPLE_WORDS:
+        logger.info(f"Routing as complex ({len(words)} words): {query}")
+        return "complex"
+
+    if embeddings is not None:
+        try:
+            similarity = faq_similarity(query, embeddings)
+        except Exception as e:
+            logger.error(f"Error comparing the query with FAQ questions: {str(e)}")
+            similarity = None
+        if similarity is not None and similarity >= ROUTER_FAQ_THRESHOLD:
+            logger.info(f"Routing as simple (FAQ similarity {similarity:.3f}): {query}")
+            return "simple"
+
+    density = keyword_density(words)
+    multi_part = MULTI_PART_PATTERN.search(query) is not None
+    route = "simple" if words and not multi_part and density >= ROUTER_MIN_KEYWORD_DENSITY else "complex"
+    logger.info(f"Routing as {route} ({len(words)} words, keyword density {density:.2f}, multi-part {multi_part}): {query}")
+    return route
+
+def tools_condition(state) -> str:
+    # Conditional edge after the routing node
+    return state.get("route") or "complex"
@@ -1,32 +1,89 @@
 #src/workflow.py
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph, START
+from src.configs.config import QUERY_TRANSFORMATION_MODE, SUMMARIZATION_ENABLED, ROUTER_ENABLED, NODE_CACHE_ENABLED
+from src.metrics import instrument_node
+from src.node_memo import NODE_INPUT_FIELDS, memoize_node
+from src.state_tracing import trace_node
+from src.tools_condition import tools_condition
 from src.nodes_and_edges import (
+    query_routing_node,
     query_rewriting_node,
     step_back_prompting_node,
     sub_query_decomposition_node,
+    query_transformation_node,
     retrieval_node,
+    context_assembly_node,
     summarization_node,
-    final_generation_node
+    final_generation_node,
+    aquery_routing_node,
+    aquery_rewriting_node,
+    astep_back_prompting_node,
+    asub_query_decomposition_node,
+    aquery_transformation_node,
+    aretrieval_node,
+    acontext_assembly_node,
+    asummarization_node,
+    afinal_generation_node
 )
 
-def create_workflow(agent_state_class):
+def create_workflow(agent_state_class, query_transformation_mode=QUERY_TRANSFORMATION_MODE, summarization=SUMMARIZATION_ENABLED, routing=ROUTER_ENABLED, memoize=NODE_CACHE_ENABLED, node_wrapper=None):
     workflow = StateGraph(agent_state_class)
+
+    # Every node is traced and instrumented for metrics; node_wrapper(name, func)
+    # lets callers such as the benchmarks wrap them further. Each node is
+    # registered with its sync and async implementation, so the compiled graph
+    # runs the sync ones under invoke/stream and the async ones under
+    # ainvoke/abatch/astream. With memoize, a query transformation node whose
+    # input fields are unchanged since an earlier request replays its stored
+    # output.
+    def wrap(name, func):
+        if memoize and name in NODE_INPUT_FIELDS:
+            func = memoize_node(name, func, NODE_INPUT_FIELDS[name])
+        func = instrument_node(name, trace_node(name, func))
+        return node_wrapper(name, func) if node_wrapper else func
+
+    def add_node(name, func, afunc):
+        workflow.add_node(name, RunnableLambda(wrap(name, func), afunc=wrap(name, afunc), name=name))
     
     # Define nodes and edges
-    workflow.add_node("query_rewriting", query_rewriting_node)
-    workflow.add_node("step_back_prompting", step_back_prompting_node)
-    workflow.add_node("sub_query_decomposition", sub_query_decomposition_node)
-    workflow.add_node("retrieval", retrieval_node)
-    #workflow.add_node("summarization", summarization_node)
-    workflow.add_node("final_generation", final_generation_node)
+    if routing:
+        add_node("query_routing", query_routing_node, aquery_routing_node)
+    if query_transformation_mode == "single_call":
+        add_node("query_transformation", query_transformation_node, aquery_transformation_node)
+    else:
+        add_node("query_rewriting", query_rewriting_node, aquery_rewriting_node)
+        add_node("step_back_prompting", step_back_prompting_node, astep_back_prompting_node)
+        add_node("sub_query_decomposition", sub_query_decomposition_node, asub_query_decomposition_node)
+    add_node("retrieval", retrieval_node, aretrieval_node)
+    add_node("context_assembly", context_assembly_node, acontext_assembly_node)
+    if summarization:
+        add_node("summarization", summarization_node, asummarization_node)
+    add_node("final_generation", final_generation_node, afinal_generation_node)
     
     # Define the flow of nodes
-    workflow.add_edge(START, "query_rewriting")
-    workflow.add_edge("query_rewriting", "step_back_prompting")
-    workflow.add_edge("step_back_prompting", "sub_query_decomposition")
-    workflow.add_edge("sub_query_decomposition", "retrieval")
-    #workflow.add_edge("retrieval", "summarization")
-    workflow.add_edge("retrieval", "final_generation")
+    transformation_entry = "query_transformation" if query_transformation_mode == "single_call" else "query_rewriting"
+    if routing:
+        # Simple queries go straight to retrieval, complex ones through query transformation
+        workflow.add_edge(START, "query_routing")
+        workflow.add_conditional_edges("query_routing", tools_condition, {"simple": "retrieval", "complex": transformation_entry})
+    else:
+        workflow.add_edge(START, transformation_entry)
+
+    if query_transformation_mode == "single_call":
+        workflow.add_edge("query_transformation", "retrieval")
+    else:
+        # Step-back prompting and decomposition both only need the rewritten
+        # query, so they run as parallel branches that join before retrieval
+        workflow.add_edge("query_rewriting", "step_back_prompting")
+        workflow.add_edge("query_rewriting", "sub_query_decomposition")
+        workflow.add_edge(["step_back_prompting", "sub_query_decomposition"], "retrieval")
+    workflow.add_edge("retrieval", "context_assembly")
+    if summarization:
+        workflow.add_edge("context_assembly", "summarization")
+        workflow.add_edge("summarization", "final_generation")
+    else:
+        workflow.add_edge("context_assembly", "final_generation")
     workflow.add_edge("final_generation", END)
 
     return workflow
@@ -1,22 +1,46 @@
 import streamlit as st
 import logging
-from workflow_setup import initialize_workflow
+import uuid
+from langchain_core.messages import AIMessageChunk
+from workflow_setup import get_graph
 from llm_utils import auto_populate_fields
 from state_management import initialize_session_state, get_session_state
+from src.agent_state import new_request
+from src.configs.config import ASYNC_LOGGING, CHECKPOINTING_ENABLED
+from src.providers import warm_up
+from src.state_tracing import enable_async_logging
 
 # Set up logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
+if ASYNC_LOGGING:
+    enable_async_logging()
 
 # Streamlit App
 st.title("🦜🔗 Langchain Agentic RAG Search")
 
+@st.cache_resource
+def load_graph():
+    # Runs once per server process: compile the graph and create the model and
+    # vector store clients up front, so reruns and new sessions reuse them
+    graph = get_graph(checkpointed=CHECKPOINTING_ENABLED)
+    try:
+        logger.info(f"Warmed up providers: {warm_up()}")
+    except Exception as e:
+        logger.error(f"Error warming up providers: {str(e)}")
+    return graph
+
 # Initialize workflow
-graph = initialize_workflow()
+graph = load_graph()
 
 # Initialize session state
 initialize_session_state()
 
+# Each browser session is one checkpointer thread, so resubmitting the form
+# continues from the session's previous state
+if "thread_id" not in st.session_state:
+    st.session_state.thread_id = str(uuid.uuid4())
+
 # User input outside the form for auto-populate
 user_input = st.text_area("Enter your query:", help="Describe your query or the information you seek in detail.")
 
@@ -71,27 +95,37 @@ with st.form("query_form"):
         )
 
         # Combine inputs into messages and metadata
-        inputs = {
-            "messages": [("user", message_content)],
-            "metadata": {
-                "keywords": keywords.split(', '),
-                "content_type": content_type,
-            }
-        }
-
-        final_state = None
-        for output in graph.stream(inputs):
-            final_state = output  # Store the last state
-            for key, value in output.items():
-                st.write(f"Output from node '{key}':")
-                st.write(value)
-
-        if final_state:
-            # Display the final response if it exists
-            if "final_response" in final_state.get("final_generation", {}):
-                st.subheader("Final Response:")
-                st.write(final_state["final_generation"]["final_response"])
-            else:
-                st.error("No final response generated.")
-        else:
+        inputs = new_request(message_content, metadata={
+            "keywords": [keyword.strip() for keyword in keywords.split(",") if keyword.strip()],
+            "content_type": content_type,
+        })
+        config = {"configurable": {"thread_id": st.session_state.thread_id}}
+
+        # Intermediate node outputs are collected in collapsed sections above the answer
+        node_outputs = st.container()
+        st.subheader("Final Response:")
+
+        final_state = {}
+        def stream_final_response():
+            # "updates" carries each node's output, "messages" the final answer's tokens
+            for mode, chunk in graph.stream(inputs, config=config, stream_mode=["updates", "messages"]):
+                if mode == "updates":
+                    for key, value in chunk.items():
+                        final_state[key] = value
+                        with node_outputs.expander(f"Output from node '{key}'"):
+                            st.write(value)
+                else:
+                    # Only model token chunks; the node's own state messages are skipped
+                    message, metadata = chunk
+                    if metadata.get("langgraph_node") == "final_generation" and isinstance(message, AIMessageChunk) and message.content:
+                        yield message.content
+
+        streamed_response = st.write_stream(stream_final_response())
+
+        if not final_state:
             st.error("No final state available.")
+        elif not (final_state.get("final_generation") or {}).get("final_response"):
+            st.error("No final response generated.")
+        elif not streamed_response:
+            # Nothing was streamed, e.g. the model does not support streaming
+            st.write(final_state["final_generation"]["final_response"])
@@ -0,0 +1,282 @@
+# tests/test_resilience.py
+# Resilience policies against the fake embeddings server from the benchmarks.
+#
+#   python -m pytest tests
+import asyncio
+import random
+import threading
+import time
+import httpx
+import pytest
+from benchmarks.fakes import FakeEmbeddingServer
+from src.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, ResiliencePolicy, backoff_delay
+
+@pytest.fixture
+def server():
+    server = FakeEmbeddingServer(latency_ms=0, tail_rate=0, tail_ms=0, error_rate=0)
+    yield server
+    server.close()
+
+@pytest.fixture
+def client():
+    with httpx.Client() as client:
+        yield client
+
+def embedder(client, server):
+    def embed(text="text"):
+        response = client.post(server.url, json={"input": [text]})
+        response.raise_for_status()
+        return response.json()["data"][0]["embedding"]
+    return embed
+
+def policy(**kwargs):
+    # Thresholds out of reach unless a test sets them
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=100, reset_seconds=60))
+    return ResiliencePolicy("test", **kwargs)
+
+def test_backoff_delay_is_jittered_below_the_exponential_bound():
+    random.seed(0)
+    for attempt in range(6):
+        delays = [backoff_delay(attempt, base=0.1, max_delay=1.0) for _ in range(200)]
+        assert all(0 <= delay <= min(1.0, 0.1 * 2 ** attempt) for delay in delays)
+        assert len(set(delays)) > 1
+
+def test_retries_server_errors_until_success(server, client):
+    server.script = [(0, 503), (0, 503)]
+    resilient = policy(max_attempts=3)
+
+    assert len(resilient.call(embedder(client, server))) == server.dimension
+    assert server.requests == 3
+    assert resilient.stats()["retries"] == 2
+    assert resilient.stats()["failures"] == 0
+
+def test_gives_up_after_max_attempts(server, client):
+    server.error_rate = 1.0
+    resilient = policy(max_attempts=3)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        resilient.call(embedder(client, server))
+    assert server.requests == 3
+    assert resilient.stats()["failures"] == 1
+
+@pytest.mark.parametrize("status, requests", [(400, 1), (429, 2), (408, 2)])
+def test_retries_only_retryable_statuses(server, client, status, requests):
+    server.script = [(0, status)]
+    resilient = policy(max_attempts=3)
+
+    if requests == 1:
+        with pytest.raises(httpx.HTTPStatusError):
+            resilient.call(embedder(client, server))
+    else:
+        resilient.call(embedder(client, server))
+    assert server.requests == requests
+
+def test_backoff_waits_between_attempts(server, client, monkeypatch):
+    monkeypatch.setattr("src.resilience.backoff_delay", lambda attempt: 0.1 * 2 ** attempt)
+    server.script = [(0, 503), (0, 503)]
+    resilient = policy(max_attempts=3)
+
+    start = time.monotonic()
+    resilient.call(embedder(client, server))
+    assert time.monotonic() - start >= 0.3
+
+def test_deadline_expires_on_a_slow_response(server, client):
+    server.latency_ms = 1000
+    resilient = policy(deadline_seconds=0.2)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        resilient.call(embedder(client, server))
+    assert time.monotonic() - start < 0.6
+    assert resilient.stats()["timeouts"] >= 1
+
+def test_deadline_includes_retries(server, client, monkeypatch):
+    # The second backoff would end past the deadline, so the call stops there
+    monkeypatch.setattr("src.resilience.backoff_delay", lambda attempt: 0.2)
+    server.error_rate = 1.0
+    resilient = policy(deadline_seconds=0.3, max_attempts=5)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        resilient.call(embedder(client, server))
+    assert server.requests == 2
+
+def test_async_deadline_expires_on_a_slow_response(server):
+    server.latency_ms = 1000
+    resilient = policy(deadline_seconds=0.2)
+
+    async def embed():
+        async with httpx.AsyncClient() as client:
+            response = await client.post(server.url, json={"input": ["text"]})
+            response.raise_for_status()
+            return response.json()
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(resilient.acall(embed))
+
+def test_breaker_opens_after_consecutive_failures(server, client):
+    server.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    resilient = policy(max_attempts=1, breaker=breaker)
+    embed = embedder(client, server)
+
+    for _ in range(2):
+        assert breaker.state == "closed"
+        with pytest.raises(httpx.HTTPStatusError):
+            resilient.call(embed)
+    assert breaker.state == "open"
+
+    # While open, calls fail fast without reaching the server
+    with pytest.raises(CircuitOpenError):
+        resilient.call(embed)
+    assert server.requests == 2
+    assert resilient.stats()["short_circuits"] == 1
+
+def open_breaker(server, client, reset_seconds=0.1):
+    server.script = [(0, 503)]
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=reset_seconds)
+    resilient = policy(max_attempts=1, breaker=breaker)
+    with pytest.raises(httpx.HTTPStatusError):
+        resilient.call(embedder(client, server))
+    assert breaker.state == "open"
+    time.sleep(reset_seconds)
+    return breaker, resilient
+
+def test_breaker_trial_success_closes(server, client):
+    breaker, resilient = open_breaker(server, client)
+
+    resilient.call(embedder(client, server))
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+def test_breaker_trial_failure_reopens(server, client):
+    breaker, resilient = open_breaker(server, client)
+    server.script = [(0, 503)]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        resilient.call(embedder(client, server))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        resilient.call(embedder(client, server))
+
+def test_breaker_trial_non_retryable_error_closes(server, client):
+    # A 400 means the upstream answered, so the trial must not stay pending
+    breaker, resilient = open_breaker(server, client)
+    server.script = [(0, 400)]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        resilient.call(embedder(client, server))
+    assert breaker.state == "closed"
+    resilient.call(embedder(client, server))
+
+def test_breaker_trial_local_error_leaves_breaker_alone(server, client):
+    # A bug in the caller never reached the upstream, so it proves nothing
+    breaker, resilient = open_breaker(server, client)
+
+    def broken():
+        raise TypeError("local bug")
+
+    with pytest.raises(TypeError):
+        resilient.call(broken)
+    assert breaker.state == "half_open"
+    assert server.requests == 1
+
+def test_breaker_allows_one_trial_at_a_time():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.1)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.1)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    # A trial that never reports back is replaced after reset_seconds
+    time.sleep(0.1)
+    assert breaker.allow()
+
+def test_hedge_wins_over_a_slow_request(server, client):
+    # Warm-up latency well above connection setup, so the primary request
+    # reaches the server before the hedge does
+    server.latency_ms = 50
+    resilient = policy(hedge=True, hedge_min_samples=5, deadline_seconds=5)
+    embed = embedder(client, server)
+    for _ in range(5):
+        resilient.call(embed)
+    assert resilient.hedge_delay() is not None
+
+    # The first request stalls; the duplicate sent after the hedge delay answers
+    server.script = [(2000, 200), (0, 200)]
+    start = time.monotonic()
+    resilient.call(embed)
+    assert time.monotonic() - start < 1.0
+    assert resilient.stats()["hedges"] == 1
+    assert resilient.stats()["hedge_wins"] == 1
+
+def test_no_hedge_before_enough_samples(server, client):
+    resilient = policy(hedge=True, hedge_min_samples=5)
+    server.script = [(200, 200)]
+
+    resilient.call(embedder(client, server))
+    assert server.requests == 1
+    assert resilient.stats()["hedges"] == 0
+
+def test_stream_retries_only_before_the_first_chunk():
+    attempts = []
+
+    def stream(abandoned):
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise ConnectionError("before the first chunk")
+        yield "a"
+        if len(attempts) == 2:
+            raise ConnectionError("after the first chunk")
+        yield "b"
+
+    chunks = []
+    with pytest.raises(ConnectionError, match="after the first chunk"):
+        for chunk in policy(max_attempts=3).stream(stream):
+            chunks.append(chunk)
+    assert chunks == ["a"]
+    assert len(attempts) == 2
+
+def test_stream_deadline_bounds_the_first_chunk_only():
+    def stream(abandoned, first_delay):
+        time.sleep(first_delay)
+        for chunk in ["a", "b", "c"]:
+            yield chunk
+            time.sleep(0.15)
+
+    # The whole stream outlasts the deadline; only its first chunk has to beat it
+    assert list(policy(deadline_seconds=0.2).stream(stream, first_delay=0)) == ["a", "b", "c"]
+
+    with pytest.raises(DeadlineExceededError):
+        list(policy(deadline_seconds=0.2).stream(stream, first_delay=0.5))
+
+def test_stream_abandoned_attempt_stops_producing():
+    produced = []
+
+    def stream(abandoned):
+        time.sleep(0.3)
+        for chunk in range(10):
+            produced.append(chunk)
+            yield chunk
+            time.sleep(0.02)
+
+    with pytest.raises(DeadlineExceededError):
+        list(policy(deadline_seconds=0.1).stream(stream))
+    time.sleep(0.5)
+    assert produced == [0]
+
+def test_stream_is_read_on_the_caller_thread_after_the_first_chunk():
+    # Only the wait for the first chunk may hold a worker; a long answer must
+    # not keep one busy
+    threads = []
+
+    def stream(abandoned):
+        for chunk in range(3):
+            threads.append(threading.current_thread())
+            yield chunk
+
+    assert list(policy(deadline_seconds=1).stream(stream)) == [0, 1, 2]
+    assert threads[0] is not threading.current_thread()
+    assert threads[1:] == [threading.current_thread()] * 2
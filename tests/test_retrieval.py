@@ -0,0 +1,47 @@
+# tests/test_retrieval.py
+import threading
+import time
+from src.retrieval import retrieve_sub_queries
+
+class Embeddings:
+    def embed_documents(self, texts):
+        return [[float(i)] for i in range(len(texts))]
+
+class VectorStore:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Later sub-queries finish first, so order comes from the input
+        time.sleep(0.05 / (1 + embedding[0]))
+        with self._lock:
+            self.in_flight -= 1
+        if embedding[0] == 2:
+            raise ConnectionError("search failed")
+        return [(f"doc {int(embedding[0])}", 1.0)]
+
+def test_results_keep_order_and_bound_concurrency():
+    store = VectorStore()
+    sub_queries = [f"q{i}" for i in range(6)]
+
+    results = retrieve_sub_queries(store, Embeddings(), sub_queries, max_concurrency=2)
+    assert results == [[(f"doc {i}", 1.0)] if i != 2 else [] for i in range(6)]
+    assert store.max_in_flight == 2
+
+def retrieval_threads():
+    return {thread for thread in threading.enumerate() if thread.name.startswith("retrieval")}
+
+def test_requests_share_one_pool():
+    retrieve_sub_queries(VectorStore(), Embeddings(), ["a", "b", "c", "d"])
+    threads = retrieval_threads()
+    assert threads
+
+    # The same threads serve later requests instead of a pool per call
+    for _ in range(5):
+        retrieve_sub_queries(VectorStore(), Embeddings(), ["a", "b", "c", "d"])
+    assert retrieval_threads() == threads
@@ -0,0 +1,121 @@
+# tests/test_semantic_cache.py
+import asyncio
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.semantic_cache import SemanticCache, SemanticCachedGraph
+
+def mix(rng, base, cosine):
+    # Unit vectors at the given cosine similarity to each row of base
+    noise = rng.standard_normal(base.shape).astype(np.float32)
+    noise -= np.sum(noise * base, axis=-1, keepdims=True) * base
+    noise /= np.linalg.norm(noise, axis=-1, keepdims=True)
+    return cosine * base + np.sqrt(1 - cosine ** 2) * noise
+
+def unit(rng, dimension):
+    vector = rng.standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_recall_on_clustered_entries():
+    # Every entry is on one topic (pairwise cosine about 0.5), and each query
+    # has 40 cached rephrasings at 0.90 around it that compete with the true
+    # 0.96 duplicate for the shortlist
+    rng = np.random.default_rng(0)
+    dimension, entries, queries = 1536, 10000, 50
+    topic = unit(rng, dimension)
+    vectors = mix(rng, np.tile(topic, (entries, 1)), np.sqrt(0.5))
+    cache = SemanticCache(None, max_entries=entries + 40 * queries)
+    for i, vector in enumerate(vectors):
+        cache.add(f"q{i}", f"r{i}", vector)
+
+    found = 0
+    for j, i in enumerate(rng.choice(entries, queries, replace=False)):
+        query = mix(rng, vectors[i][None, :], 0.96)[0]
+        for k, rephrasing in enumerate(mix(rng, np.tile(query, (40, 1)), 0.90)):
+            cache.add(f"p{j}.{k}", f"p{j}.{k}", rephrasing)
+        found += cache.lookup("query", query) == f"r{i}"
+    assert found == queries
+
+def test_lookup_respects_scope_and_threshold():
+    rng = np.random.default_rng(1)
+    vector = unit(rng, 64)
+    cache = SemanticCache(None, similarity_threshold=0.95)
+    cache.add("q", "scoped", vector, scope="a")
+
+    assert cache.lookup("q", vector, scope="a") == "scoped"
+    assert cache.lookup("q", vector, scope="b") is None
+    assert cache.lookup("q", mix(rng, vector[None, :], 0.9)[0], scope="a") is None
+
+def test_scopes_are_released_with_their_last_entry():
+    rng = np.random.default_rng(2)
+    cache = SemanticCache(None, max_entries=4)
+    for i in range(100):
+        cache.add("q", f"r{i}", unit(rng, 32), scope=f"scope {i}")
+    assert len(cache._scopes) == 4
+    assert set(cache._scopes) == {f"scope {i}" for i in range(96, 100)}
+
+class FakeGraph:
+    def __init__(self):
+        self.calls = 0
+
+    def _answer(self, inputs):
+        self.calls += 1
+        return {"final_response": f"answer to {inputs['initial_query']}"}
+
+    def invoke(self, inputs, config=None, **kwargs):
+        return self._answer(inputs)
+
+    def batch(self, inputs, config=None, **kwargs):
+        return [self._answer(item) for item in inputs]
+
+    async def abatch(self, inputs, config=None, **kwargs):
+        return [self._answer(item) for item in inputs]
+
+    async def astream(self, inputs, config=None, stream_mode="updates", **kwargs):
+        yield {"final_generation": self._answer(inputs)}
+
+    async def astream_events(self, inputs, config=None, **kwargs):
+        yield {}
+
+def cached_graph():
+    return SemanticCachedGraph(FakeGraph(), SemanticCache(DeterministicFakeEmbedding(size=64)))
+
+def test_batch_answers_repeats_from_the_cache():
+    graph = cached_graph()
+    inputs = [{"initial_query": query} for query in ["a", "b"]]
+
+    first = graph.batch(inputs)
+    assert graph.batch(inputs + [{"initial_query": "c"}]) == first + [{"final_response": "answer to c"}]
+    assert graph.graph.calls == 3
+
+def test_async_runs_use_the_cache():
+    graph = cached_graph()
+
+    async def run():
+        await graph.abatch([{"initial_query": "a"}])
+        chunks = [chunk async for chunk in graph.astream({"initial_query": "a"})]
+        assert chunks == [{"final_generation": {"final_response": "answer to a"}}]
+        chunks = [chunk async for chunk in graph.astream({"initial_query": "b"})]
+        assert (await graph.abatch([{"initial_query": "b"}]))[0]["final_response"] == "answer to b"
+
+    asyncio.run(run())
+    assert graph.graph.calls == 2
+
+def test_uncached_run_methods_are_refused():
+    with pytest.raises(AttributeError):
+        cached_graph().astream_events({"initial_query": "a"})
+
+def test_scope_is_the_metadata_that_filters(monkeypatch):
+    metadata = {"content_type": "Step-by-Step Tutorial", "keywords": ["rag"]}
+    monkeypatch.setattr("src.retrieval.METADATA_FILTER_FIELDS", "")
+    graph = cached_graph()
+    graph.invoke({"initial_query": "a", "metadata": metadata})
+    graph.invoke({"initial_query": "a", "metadata": {}})
+    assert graph.graph.calls == 1
+
+    monkeypatch.setattr("src.retrieval.METADATA_FILTER_FIELDS", "content_type")
+    graph = cached_graph()
+    graph.invoke({"initial_query": "a", "metadata": metadata})
+    graph.invoke({"initial_query": "a", "metadata": {**metadata, "keywords": ["other"]}})
+    graph.invoke({"initial_query": "a", "metadata": {}})
+    assert graph.graph.calls == 2
@@ -1,8 +1,52 @@
+import os
+import sqlite3
+import threading
 from src.workflow import create_workflow
 from src.agent_state import AgentState
+from src.configs.config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES
+from src.configs.config import CHECKPOINT_PATH
 
-def initialize_workflow():
+def create_checkpointer(path=CHECKPOINT_PATH):
+    # One SQLite file shared by all sessions; each session is its own thread_id.
+    # SqliteSaver is synchronous, so the checkpointed graph is driven with
+    # invoke/stream (as Streamlit does), not ainvoke/astream. Old checkpoints
+    # and idle threads are pruned as new ones are written.
+    from src.checkpointer import RetainingSqliteSaver
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return RetainingSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+def initialize_workflow(semantic_cache=SEMANTIC_CACHE_ENABLED, checkpointer=None):
     # Create and compile the workflow graph
     workflow = create_workflow(AgentState)
-    graph = workflow.compile()
+    graph = workflow.compile(checkpointer=checkpointer)
+
+    # Optionally answer near-duplicate queries from the semantic cache
+    if semantic_cache:
+        from src.providers import get_embeddings
+        from src.semantic_cache import SemanticCache, SemanticCachedGraph
+
+        cache = SemanticCache(
+            get_embeddings(),
+            similarity_threshold=SEMANTIC_CACHE_THRESHOLD,
+            ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+            max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+        )
+        graph = SemanticCachedGraph(graph, cache)
+    return graph
+
+_graphs = {}
+_graph_lock = threading.Lock()
+
+def get_graph(checkpointed=False):
+    # The compiled graph holds no per-request state, so one instance is built
+    # per process and shared by every session and batch worker. The
+    # checkpointed variant persists each thread_id's state between requests.
+    graph = _graphs.get(checkpointed)
+    if graph is None:
+        with _graph_lock:
+            graph = _graphs.get(checkpointed)
+            if graph is None:
+                graph = initialize_workflow(checkpointer=create_checkpointer() if checkpointed else None)
+                _graphs[checkpointed] = graph
     return graph